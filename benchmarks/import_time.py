@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Startup Import-Time Benchmark
+=============================
+
+Profiles the startup of the analysis entry points with ``python -X importtime`` and
+writes a report, so that startup regressions show up in review:
+
+    benchmarks/import_time_report.md   table of wall times, import times and slowest imports
+    benchmarks/import_time.json        the same numbers, used as the baseline for --check
+                                       (written only with --update-baseline)
+
+Each entry point is started the way a user or a pipeline would start it without doing
+any work (e.g. ``main.py --help``), several times, and the fastest run is reported.
+Besides the timings the report lists any heavy library (spaCy, torch, matplotlib, ...)
+that was imported at startup; these should only be imported by the stage that needs
+them.
+
+Usage::
+
+    python benchmarks/import_time.py                      # write the report
+    python benchmarks/import_time.py --check              # also fail on heavy imports or a slower startup
+    python benchmarks/import_time.py --update-baseline    # check, then save these timings as the new baseline
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(ROOT, 'benchmarks')
+
+# name -> (working directory relative to the repository root, arguments after `python -X importtime`)
+ENTRY_POINTS = {
+    'noun-phrase main.py --help': ('noun-phrase-analysis', ['main.py', '--help']),
+    'dative main.py --help': ('dative-alternation-analysis', ['main.py', '--help']),
+    'modal main.py --help': ('modal-patterns-analysis', ['main.py', '--help']),
+    'topic sweep.py --help': ('topic-modeling-lexical-representation', ['sweep.py', '--help']),
+    'topic helper modules': ('topic-modeling-lexical-representation',
+                             ['-c', 'import sys; sys.path.append(".."); import diagnostics, embedding_store']),
+    'common package': ('.', ['-c', 'import common.corpus, common.execution, common.incremental, '
+                                   'common.lemmatize, common.memory, common.parse_cache, common.rendering']),
+}
+
+# Libraries that take seconds to import or load models; none should be imported at startup
+HEAVY_MODULES = ['spacy', 'torch', 'thinc', 'transformers', 'matplotlib', 'seaborn', 'scipy', 'sklearn',
+                 'bertopic', 'umap', 'hdbscan', 'keybert', 'sentence_transformers', 'openai', 'gensim',
+                 'pyarrow', 'networkx']
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """
+    Parse the -X importtime output.
+
+    Returns:
+        List of (module, self_us, cumulative_us, depth) tuples
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def profile(directory, args, repeat=3):
+    """
+    Start one entry point several times and keep the fastest run.
+
+    Returns:
+        Dict with the wall time, total import time, slowest top-level imports and heavy modules
+    """
+    best = None
+    for _ in range(repeat):
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=os.path.join(ROOT, directory),
+                                capture_output=True, text=True, env=env)
+        wall = time.perf_counter() - start
+        if best is None or wall < best[0]:
+            best = (wall, result)
+
+    wall, result = best
+    imports = parse_importtime(result.stderr)
+    top_level = [(module, cumulative) for module, _, cumulative, depth in imports if depth == 0]
+    modules = {module.split('.')[0] for module, _, _, _ in imports}
+    errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+    return {
+        'wall_s': round(wall, 3),
+        'import_s': round(sum(cumulative for _, cumulative in top_level) / 1e6, 3),
+        'n_modules': len(imports),
+        'slowest': [[module, round(cumulative / 1e6, 3)]
+                    for module, cumulative in sorted(top_level, key=lambda item: -item[1])[:10]],
+        'heavy': sorted(module for module in HEAVY_MODULES if module in modules),
+        'returncode': result.returncode,
+        'error': errors[-1] if result.returncode and errors else None,
+    }
+
+
+def write_report(results, path):
+    lines = ['# Startup import times', '',
+             f'Generated by `python benchmarks/import_time.py` with Python {sys.version.split()[0]} '
+             f'on {sys.platform}. Fastest of several runs.', '',
+             '| Entry point | Wall time (s) | Import time (s) | Modules | Heavy imports |',
+             '|---|---|---|---|---|']
+    for name, result in results.items():
+        heavy = ', '.join(result['heavy']) or '-'
+        if result['error']:
+            heavy += f" (failed: {result['error']})"
+        lines.append(f"| {name} | {result['wall_s']:.3f} | {result['import_s']:.3f} | {result['n_modules']} | {heavy} |")
+    for name, result in results.items():
+        lines += ['', f'## {name}', '', '| Slowest top-level imports | Cumulative (s) |', '|---|---|']
+        lines += [f'| {module} | {seconds:.3f} |' for module, seconds in result['slowest']]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def check(results, baseline, tolerance):
+    """Return a list of regressions against the baseline (and of heavy imports at startup)."""
+    problems = []
+    for name, result in results.items():
+        if result['returncode']:
+            problems.append(f"{name}: exited with {result['returncode']} ({result['error']})")
+        if result['heavy']:
+            problems.append(f"{name}: imports {', '.join(result['heavy'])} at startup")
+        previous = baseline.get(name)
+        # Ignore differences below 0.1 s, which are within the noise of process startup
+        if previous and result['wall_s'] > previous['wall_s'] * (1 + tolerance) + 0.1:
+            problems.append(f"{name}: startup {result['wall_s']:.3f}s vs {previous['wall_s']:.3f}s in the baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the startup import time of the analysis entry points')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per entry point (the fastest is reported)')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error on heavy startup imports or a startup slower than the saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown for --check')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='save the timings as the baseline for --check (runs the checks first and '
+                             'keeps the old baseline if they fail)')
+    args = parser.parse_args()
+
+    json_path = os.path.join(BENCHMARK_DIR, 'import_time.json')
+    baseline = {}
+    if os.path.exists(json_path):
+        with open(json_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {name: profile(directory, entry_args, args.repeat)
+               for name, (directory, entry_args) in ENTRY_POINTS.items()}
+    for name, result in results.items():
+        print(f"{name}: {result['wall_s']:.3f}s wall, {result['import_s']:.3f}s imports, "
+              f"heavy: {', '.join(result['heavy']) or 'none'}")
+
+    problems = check(results, baseline, args.tolerance) if args.check or args.update_baseline else []
+    if problems:
+        print('\n'.join(['Startup regressions:'] + problems), file=sys.stderr)
+        sys.exit(1)
+
+    # The baseline is only updated on request, and only by runs that pass
+    if args.update_baseline:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    write_report(results, os.path.join(BENCHMARK_DIR, 'import_time_report.md'))
+
+
+if __name__ == '__main__':
+    main()
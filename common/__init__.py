@@ -0,0 +1,6 @@
+"""
+Shared utilities for the Grammar Research with spaCy projects.
+
+The analysis scripts in each project directory add the repository root to
+``sys.path`` and import from this package.
+"""
@@ -0,0 +1,130 @@
+"""
+Corpus Loading
+==============
+
+Reads learner corpora as a lazy stream of ``(text, context)`` tuples for
+``nlp.pipe(..., as_tuples=True)``.
+
+Only the text column and the requested metadata columns are read. Metadata columns
+such as L1 and CEFR level are loaded as categoricals, and the input is read in chunks,
+so a multi-GB corpus is never held in memory as a whole DataFrame. CSV and Parquet
+files are supported; Parquet input requires ``pyarrow``.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import logging
+import re
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 50000
+
+# ICLE file identifiers such as "ICLE-TR-ANK-0001.1" embedded in the essay text
+ICLE_HEADER_PATTERN = re.compile(r'ICLE\-\w+\-\w+\-\d+\.\d+')
+
+
+def clean_icle_text(text):
+    """Remove ICLE identifiers and line breaks from an essay."""
+    return ICLE_HEADER_PATTERN.sub('', text).replace('\n', '')
+
+
+def _is_parquet(path):
+    return str(path).lower().endswith(('.parquet', '.pq'))
+
+
+def _available_columns(path):
+    """Return the column names of a CSV or Parquet file without reading its rows."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def read_chunks(path, columns, categorical_columns=(), chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Read selected columns of a CSV or Parquet file chunk by chunk.
+
+    Args:
+        path: Path to a .csv or .parquet file
+        columns: Columns to read
+        categorical_columns: Columns to load with the 'category' dtype; all others are read as strings
+        chunksize: Number of rows per chunk
+
+    Yields:
+        DataFrame chunks containing only the requested columns
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=list(columns)):
+            chunk = batch.to_pandas()
+            for col in categorical_columns:
+                chunk[col] = chunk[col].astype('category')
+            yield chunk
+    else:
+        dtype = {col: 'category' if col in categorical_columns else 'string' for col in columns}
+        yield from pd.read_csv(path, usecols=list(columns), dtype=dtype, chunksize=chunksize)
+
+
+def iter_corpus(path, text_column, context_columns, categorical_columns=(), text_path=None,
+                clean=None, default='unknown', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Lazily yield (text, context_dict) tuples from a corpus file.
+
+    Args:
+        path: CSV or Parquet file with the metadata (and the text, unless text_path is given)
+        text_column: Name of the text column
+        context_columns: Metadata columns to include in each context dictionary
+        categorical_columns: Metadata columns to load as categoricals (e.g. l1, cefr, Native_language)
+        text_path: Optional separate file holding text_column, aligned row by row with path
+            (a ValueError is raised if the two files have different numbers of rows)
+        clean: Optional function applied to every text (e.g. removing ICLE headers)
+        default: Context value for requested columns that are missing from the file
+        chunksize: Number of rows read at a time
+
+    Yields:
+        Tuples of (text, context_dict)
+    """
+    available = set(_available_columns(path))
+    present = [col for col in context_columns if col in available]
+    missing = [col for col in context_columns if col not in available]
+    if missing:
+        logger.warning(f"Columns {missing} not found in {path}; using '{default}'")
+    categorical = [col for col in categorical_columns if col in present]
+
+    if text_path is None:
+        meta_columns = present + ([text_column] if text_column not in present else [])
+        meta_chunks = read_chunks(path, meta_columns, categorical, chunksize)
+        text_chunks = None
+    else:
+        meta_chunks = read_chunks(path, present, categorical, chunksize)
+        text_chunks = read_chunks(text_path, [text_column], (), chunksize)
+
+    n_texts = 0
+    for meta in meta_chunks:
+        if text_chunks is None:
+            text_source = meta
+        else:
+            text_source = next(text_chunks, None)
+            if text_source is None or len(text_source) != len(meta):
+                n_text_rows = n_texts + (0 if text_source is None else len(text_source))
+                raise ValueError(f"{text_path} is not aligned with {path}: {n_text_rows} text rows "
+                                 f"for {n_texts + len(meta)} metadata rows read so far")
+        texts = text_source[text_column].fillna('').tolist()
+        if clean is not None:
+            texts = [clean(text) for text in texts]
+
+        values = [meta[col].tolist() for col in present]
+        for text, row in zip(texts, zip(*values) if values else ([()] * len(texts))):
+            context = dict(zip(present, row))
+            for col in missing:
+                context[col] = default
+            yield text, context
+        n_texts += len(texts)
+
+    if text_chunks is not None and next(text_chunks, None) is not None:
+        raise ValueError(f"{text_path} has more rows than {path} ({n_texts} metadata rows)")
+    logger.info(f"Read {n_texts} texts from {text_path or path}")
@@ -0,0 +1,131 @@
+"""
+Execution Configuration
+=======================
+
+Chooses where and how spaCy pipelines run. A GPU (CUDA or Apple MPS) is used when
+one is available; otherwise parsing falls back to the CPU and ``nlp.pipe`` is fanned
+out over a pool of worker processes, each holding its own copy of the pipeline.
+``nlp.pipe`` keeps the input order and the ``as_tuples`` context in both modes.
+
+Settings can be overridden with environment variables:
+
+- ``SPACY_DEVICE``: ``gpu`` or ``cpu``
+- ``SPACY_N_PROCESS``: number of worker processes on CPU (defaults to the number of
+  cores, at most 4: every worker loads its own copy of the transformer pipeline)
+- ``SPACY_BATCH_SIZE``: number of texts per batch
+- ``SPACY_MAX_CHARS``: longest text parsed in one piece; longer texts are split at
+  paragraph or sentence boundaries (``0`` disables splitting)
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+GPU_BATCH_SIZE = 64
+CPU_BATCH_SIZE = 16
+# Each worker holds its own copy of the pipeline (about 0.5-1 GB for en_core_web_trf)
+MAX_DEFAULT_PROCESSES = 4
+DEFAULT_MAX_CHARS = 100000
+
+
+class ExecutionConfig:
+    """Device and nlp.pipe settings shared by the analysis scripts."""
+
+    def __init__(self, device, n_process=1, batch_size=CPU_BATCH_SIZE, max_chars=DEFAULT_MAX_CHARS):
+        """
+        Args:
+            device: 'gpu' or 'cpu'
+            n_process: Number of worker processes used by nlp.pipe
+            batch_size: Number of texts per nlp.pipe batch
+            max_chars: Longest text parsed in one piece, or None to never split texts
+        """
+        self.device = device
+        self.n_process = n_process
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+
+    def pipe_kwargs(self):
+        """Keyword arguments to pass to ParseCache.pipe (or common.memory.pipe_in_pieces)."""
+        return {'n_process': self.n_process, 'batch_size': self.batch_size, 'max_chars': self.max_chars}
+
+    def __repr__(self):
+        return (f"ExecutionConfig(device={self.device!r}, n_process={self.n_process}, "
+                f"batch_size={self.batch_size}, max_chars={self.max_chars})")
+
+
+def setup_execution(prefer_gpu=True, n_process=None, batch_size=None, max_chars=None):
+    """
+    Detect the available device and build the matching execution settings.
+
+    Must be called before spacy.load so that the pipeline is allocated on the GPU.
+
+    Args:
+        prefer_gpu: Try the GPU first (ignored if SPACY_DEVICE=cpu)
+        n_process: Worker processes on CPU (defaults to $SPACY_N_PROCESS or the number of cores, at most 4)
+        batch_size: Texts per batch (defaults to $SPACY_BATCH_SIZE or a device-specific value)
+        max_chars: Longest text parsed in one piece (defaults to $SPACY_MAX_CHARS or 100000)
+
+    Returns:
+        ExecutionConfig
+    """
+    import spacy
+
+    device = os.environ.get('SPACY_DEVICE', 'gpu' if prefer_gpu else 'cpu').lower()
+    if batch_size is None and os.environ.get('SPACY_BATCH_SIZE'):
+        batch_size = int(os.environ['SPACY_BATCH_SIZE'])
+    if max_chars is None:
+        max_chars = int(os.environ.get('SPACY_MAX_CHARS', DEFAULT_MAX_CHARS))
+    max_chars = max_chars or None
+
+    # spacy.prefer_gpu covers both CUDA (cupy) and Apple MPS (PyTorch) and returns False without a GPU
+    if device == 'gpu' and spacy.prefer_gpu():
+        config = ExecutionConfig('gpu', n_process=1, batch_size=batch_size or GPU_BATCH_SIZE, max_chars=max_chars)
+    else:
+        if n_process is None:
+            n_process = int(os.environ['SPACY_N_PROCESS']) if os.environ.get('SPACY_N_PROCESS') else _default_n_process()
+        config = ExecutionConfig('cpu', n_process=max(1, n_process), batch_size=batch_size or CPU_BATCH_SIZE,
+                                 max_chars=max_chars)
+        if config.n_process > 1:
+            _limit_torch_threads()
+
+    logger.info(f"Execution settings: {config}")
+    return config
+
+
+def start_method():
+    """
+    The start method new worker processes will use. Unlike multiprocessing.get_start_method(),
+    this does not fix the global start method as a side effect.
+    """
+    return multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]
+
+
+def _default_n_process():
+    """
+    Use one process per core, up to MAX_DEFAULT_PROCESSES, where worker processes are
+    forked; every worker loads its own copy of the pipeline, so more workers would run
+    out of memory on many-core machines. With the 'spawn' start method (macOS, Windows)
+    workers re-import the calling script, which is unsafe for the top-level scripts in
+    this repository, so a single process is used unless SPACY_N_PROCESS is set explicitly.
+    """
+    if start_method() != 'fork':
+        return 1
+    n_cores = os.cpu_count() or 1
+    if n_cores > MAX_DEFAULT_PROCESSES:
+        logger.info(f"Using {MAX_DEFAULT_PROCESSES} of {n_cores} cores for parsing; set SPACY_N_PROCESS "
+                    f"to use more (each worker needs memory for its own copy of the pipeline)")
+    return min(n_cores, MAX_DEFAULT_PROCESSES)
+
+
+def _limit_torch_threads():
+    """Use one intra-op thread per worker so that the process pool does not oversubscribe the cores."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(1)
@@ -0,0 +1,185 @@
+"""
+Incremental Re-annotation
+=========================
+
+Lets an analysis script re-process only the documents that are new or changed since
+its previous run, instead of the whole corpus.
+
+A manifest stored next to the results (``<results>.manifest.json``) maps every
+annotated document to the hash of its text and metadata (the context columns copied
+into the result rows), together with the extractor version that produced the results.
+Documents are identified by their id column (e.g. ``docid_field``) or, where the corpus
+has no ids, by the hash of their text; repeated copies of the same text are told apart
+by their occurrence number (``<hash>:2``, ...). On the next run:
+
+- new documents and documents whose text or metadata changed are passed on for annotation;
+- the result rows of changed and deleted documents are dropped and the rows of the
+  re-annotated documents are merged in;
+- a changed extractor version (or a missing results file) triggers a full rebuild.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import json
+import logging
+import os
+
+import pandas as pd
+
+from common.parse_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+DOC_KEY = 'doc_key'
+
+
+class IncrementalManifest:
+    """Record of the documents behind a results file."""
+
+    def __init__(self, results_path, version, id_column=None, full=False):
+        """
+        Args:
+            results_path: Results file of the script; the manifest is stored next to it
+            version: Version of the extractors; results of another version are rebuilt
+            id_column: Context column identifying a document; the text hash is used if missing
+            full: Ignore the previous run and annotate every document
+        """
+        self.results_path = results_path
+        self.path = results_path + '.manifest.json'
+        self.version = str(version)
+        self.id_column = id_column
+        self.previous = {}
+        self.current = {}
+        self.rebuild = True
+
+        if not full and os.path.exists(self.path) and os.path.exists(results_path):
+            with open(self.path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == self.version:
+                self.previous = manifest['documents']
+                self.rebuild = False
+            else:
+                logger.info(f"Extractor version changed ({manifest.get('version')} -> {self.version}); rebuilding")
+
+    def document_key(self, text, context):
+        """Return the id of a document, or the hash of its text if it has no id."""
+        if self.id_column is not None:
+            doc_id = context.get(self.id_column)
+            if doc_id is not None and doc_id == doc_id and doc_id != 'unknown':  # not missing or NaN
+                return str(doc_id)
+        return text_hash(text)
+
+    @staticmethod
+    def document_digest(text, context):
+        """Hash of a document's text and metadata; a change of either re-annotates the document."""
+        metadata = {name: value for name, value in context.items() if name != DOC_KEY}
+        return text_hash(text + '\0' + json.dumps(metadata, sort_keys=True, default=str))
+
+    def select(self, texts_with_context):
+        """
+        Filter a (text, context) stream down to the documents that need annotation.
+
+        Every document is recorded in the new manifest, and its key is stored in the
+        context under 'doc_key' so that extractors can tag their rows with it.
+
+        Args:
+            texts_with_context: Iterable of (text, context_dict) tuples
+
+        Yields:
+            (text, context_dict) tuples of new or changed documents
+        """
+        n_seen = n_selected = 0
+        occurrences = {}
+        for text, context in texts_with_context:
+            key = self.document_key(text, context)
+            # Number repeated keys so that each copy of a duplicated text (or id) has its own rows
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if occurrences[key] > 1:
+                key = f'{key}:{occurrences[key]}'
+            digest = self.document_digest(text, context)
+            self.current[key] = digest
+            context[DOC_KEY] = key
+            n_seen += 1
+            if self.rebuild or self.previous.get(key) != digest:
+                n_selected += 1
+                yield text, context
+        logger.info(f"Incremental run: {n_selected} of {n_seen} documents new or changed, "
+                    f"{len(self.previous.keys() - self.current.keys())} deleted")
+
+    def stale_keys(self):
+        """Keys of documents whose previous rows must be dropped (changed or deleted)."""
+        return {key for key, digest in self.previous.items() if self.current.get(key) != digest}
+
+    def save(self):
+        """Write the manifest for the documents seen by select(); call after the results are saved."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'documents': self.current}, f)
+        os.replace(tmp_path, self.path)
+
+
+def merge_frames(existing, new, manifest, key_column=DOC_KEY):
+    """
+    Merge the rows of re-annotated documents into previous results.
+
+    Args:
+        existing: DataFrame of the previous run (ignored if the manifest requires a rebuild)
+        new: DataFrame of the documents annotated in this run
+        manifest: IncrementalManifest used to select the documents
+        key_column: Column holding the document key
+
+    Returns:
+        Combined DataFrame
+    """
+    if manifest.rebuild or existing is None or existing.empty:
+        return new.reset_index(drop=True)
+    stale = manifest.stale_keys()
+    kept = existing[~existing[key_column].astype(str).isin(stale)]
+    return pd.concat([kept, new], ignore_index=True)
+
+
+def merge_parquet(path, new_path, manifest, key_column=DOC_KEY):
+    """
+    Merge a Parquet file of re-annotated documents into the previous results file.
+
+    The previous results are streamed one row group at a time, so neither file is
+    loaded as a whole. The merged file replaces path and new_path is removed.
+
+    Args:
+        path: Previous results file (may not exist yet)
+        new_path: Results of the documents annotated in this run
+        manifest: IncrementalManifest used to select the documents
+        key_column: Column holding the document key
+
+    Returns:
+        Number of rows in the merged file
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    if manifest.rebuild or not os.path.exists(path):
+        os.replace(new_path, path)
+        return pq.ParquetFile(path).metadata.num_rows
+
+    stale = pa.array(sorted(manifest.stale_keys()), type=pa.string())
+    new_file = pq.ParquetFile(new_path)
+    tmp_path = path + '.tmp'
+    n_rows = 0
+    with pq.ParquetWriter(tmp_path, new_file.schema_arrow) as writer:
+        old_file = pq.ParquetFile(path)
+        for i in range(old_file.num_row_groups):
+            group = old_file.read_row_group(i)
+            keep = pc.invert(pc.is_in(group[key_column].cast(pa.string()), value_set=stale))
+            group = group.filter(keep)
+            if group.num_rows:
+                writer.write_table(group.cast(new_file.schema_arrow))
+                n_rows += group.num_rows
+        for i in range(new_file.num_row_groups):
+            group = new_file.read_row_group(i)
+            writer.write_table(group)
+            n_rows += group.num_rows
+    os.replace(tmp_path, path)
+    os.remove(new_path)
+    return n_rows
@@ -0,0 +1,119 @@
+"""
+Cached Lemmatisation
+====================
+
+Turns texts into space-separated lemma strings (stop words removed) for bag-of-words
+models such as BERTopic.
+
+Texts are lemmatised in one batched ``nlp.pipe`` stream (with the device, batch size
+and worker processes chosen by ``setup_execution``), and the resulting strings are
+cached on disk by text hash and pipeline fingerprint. Re-running a topic model on the
+same essays therefore needs no parsing at all. Only lemma strings are stored, which is
+much smaller than caching whole ``Doc`` objects.
+
+For lemmas and stop word flags the transformer is not needed: ``load_lemmatizer(
+lightweight=True)`` loads ``en_core_web_sm``, whose rule-based lemmatiser only needs the
+tagger and is many times faster on CPU.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import json
+import logging
+import os
+
+from common.memory import add_activation_cleaner, pipe_in_pieces
+from common.parse_cache import pipeline_fingerprint, text_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'grammar-research-spacy', 'lemmas')
+TRANSFORMER_MODEL = 'en_core_web_trf'
+LIGHTWEIGHT_MODEL = 'en_core_web_sm'
+
+
+def load_lemmatizer(lightweight=False):
+    """
+    Load a pipeline that only runs the components needed for lemmas and stop words.
+
+    Call setup_execution() first so that the pipeline is allocated on the right device.
+
+    Args:
+        lightweight: Use the small non-transformer pipeline instead of en_core_web_trf
+
+    Returns:
+        spaCy Language object
+    """
+    import spacy
+
+    model = LIGHTWEIGHT_MODEL if lightweight else TRANSFORMER_MODEL
+    nlp = spacy.load(model, disable=['ner', 'parser'])
+    return add_activation_cleaner(nlp)
+
+
+def lemma_string(doc, remove_stopwords=True):
+    """Join the lemmas of a Doc, leaving out stop words."""
+    return ' '.join(token.lemma_ for token in doc if not (remove_stopwords and token.is_stop))
+
+
+def lemmatize_texts(nlp, texts, remove_stopwords=True, cache_dir=None, **pipe_kwargs):
+    """
+    Lemmatise texts, reusing cached lemma strings where available.
+
+    Args:
+        nlp: Pipeline from load_lemmatizer
+        texts: Iterable of (already cleaned) texts
+        remove_stopwords: Leave out stop words
+        cache_dir: Cache directory (defaults to $LEMMA_CACHE_DIR or ~/.cache/grammar-research-spacy/lemmas)
+        **pipe_kwargs: Arguments for nlp.pipe, e.g. execution.pipe_kwargs()
+
+    Returns:
+        List of lemma strings, in input order
+    """
+    cache_dir = cache_dir or os.environ.get('LEMMA_CACHE_DIR', DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    suffix = 'nostop' if remove_stopwords else 'all'
+    cache_path = os.path.join(cache_dir, f"{pipeline_fingerprint(nlp)}-{suffix}.jsonl")
+    cache = _load_cache(cache_path)
+
+    texts = list(texts)
+    keys = [text_hash(text) for text in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cache and key not in missing:
+            missing[key] = text
+    logger.info(f"Lemma cache: {len(set(keys)) - len(missing)} cached, {len(missing)} to lemmatise")
+
+    if missing:
+        # Append each result as it arrives so that an interrupted run keeps its progress
+        with open(cache_path, 'a', encoding='utf-8') as f:
+            if f.tell() and not _ends_with_newline(cache_path):
+                f.write('\n')
+            docs = pipe_in_pieces(nlp, missing.values(), **pipe_kwargs)
+            for key, doc in zip(missing, docs):
+                cache[key] = lemma_string(doc, remove_stopwords)
+                f.write(json.dumps([key, cache[key]]) + '\n')
+
+    return [cache[key] for key in keys]
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _load_cache(cache_path):
+    """Read the hash -> lemma string cache, skipping a truncated last line."""
+    cache = {}
+    if not os.path.exists(cache_path):
+        return cache
+    with open(cache_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                key, lemmas = json.loads(line)
+            except ValueError:
+                continue
+            cache[key] = lemmas
+    return cache
@@ -0,0 +1,150 @@
+"""
+Memory-Bounded Parsing
+======================
+
+Helpers that keep the memory used by transformer pipelines bounded:
+
+- ``add_activation_cleaner`` appends spaCy's ``doc_cleaner`` component so that
+  transformer activations (``doc._.trf_data``, ``doc.tensor``) are dropped as soon as
+  the downstream components have used them, including inside worker processes.
+- ``pipe_in_pieces`` splits over-long texts at paragraph or sentence boundaries,
+  parses the pieces and merges them back into one ``Doc`` per text, so that a single
+  very long essay cannot exhaust the memory of a worker.
+- ``memory_usage_mb`` reports the resident memory of the current process.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import collections
+import os
+import re
+
+# Paragraph breaks and sentence-final punctuation followed by whitespace
+_BOUNDARY = re.compile(r'\n\s*\n|(?<=[.!?])\s+')
+
+
+def add_activation_cleaner(nlp):
+    """
+    Drop transformer activations from every Doc at the end of the pipeline.
+
+    Args:
+        nlp: Loaded spaCy Language object
+
+    Returns:
+        The same Language object
+    """
+    from spacy.tokens import Doc
+
+    if 'doc_cleaner' in nlp.pipe_names:
+        return nlp
+    attrs = {'tensor': None}
+    if Doc.has_extension('trf_data'):
+        attrs['_.trf_data'] = None
+    nlp.add_pipe('doc_cleaner', last=True, config={'attrs': attrs, 'silent': True})
+    return nlp
+
+
+def memory_usage_mb():
+    """Return the resident memory of the current process in MB (NaN if it cannot be measured)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def split_text(text, max_chars):
+    """
+    Split a text into pieces of at most max_chars characters.
+
+    Pieces end at paragraph or sentence boundaries where possible; a single sentence
+    longer than max_chars is cut after the last whitespace before the limit, or at the
+    limit itself (possibly inside a word) if there is none. Joining the pieces gives
+    back the original text.
+
+    Args:
+        text: Text to split
+        max_chars: Maximum piece length, or None to never split
+
+    Returns:
+        List of text pieces
+    """
+    if max_chars is None or len(text) <= max_chars:
+        return [text]
+
+    units = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        units.append(text[start:match.end()])
+        start = match.end()
+    units.append(text[start:])
+
+    pieces = []
+    current = ''
+    for unit in units:
+        while len(unit) > max_chars:
+            cut = max(unit.rfind(space, 0, max_chars) for space in ' \n\t') + 1 or max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(unit[:cut])
+            unit = unit[cut:]
+        if current and len(current) + len(unit) > max_chars:
+            pieces.append(current)
+            current = ''
+        current += unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pipe_in_pieces(nlp, texts, max_chars=None, as_tuples=False, **pipe_kwargs):
+    """
+    Like nlp.pipe, but parse over-long texts in pieces and merge them into one Doc.
+
+    All pieces go through a single nlp.pipe call, so batching and multiprocessing
+    work as usual, and the output keeps the input order.
+
+    Args:
+        nlp: Loaded spaCy Language object
+        texts: Iterable of texts, or of (text, context) tuples if as_tuples is True
+        max_chars: Maximum characters parsed at once, or None to never split
+        as_tuples: Whether texts contains (text, context) tuples
+        **pipe_kwargs: Extra keyword arguments passed on to nlp.pipe
+
+    Yields:
+        Doc objects, or (Doc, context) tuples
+    """
+    from spacy.tokens import Doc
+
+    if max_chars is None:
+        yield from nlp.pipe(texts, as_tuples=as_tuples, **pipe_kwargs)
+        return
+
+    pending = collections.deque()
+
+    def pieces():
+        for item in texts:
+            text, context = item if as_tuples else (item, None)
+            parts = split_text(text, max_chars)
+            pending.append((len(parts), context))
+            yield from parts
+
+    docs = nlp.pipe(pieces(), **pipe_kwargs)
+    for first in docs:
+        n_parts, context = pending.popleft()
+        parts = [first] + [next(docs) for _ in range(n_parts - 1)]
+        # The pieces already carry their own whitespace; adding a space between them would
+        # shift the character offsets, e.g. after a cut inside a word
+        doc = parts[0] if n_parts == 1 else Doc.from_docs(parts, ensure_whitespace=False)
+        if as_tuples:
+            yield doc, context
+        else:
+            yield doc
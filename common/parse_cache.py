@@ -0,0 +1,273 @@
+"""
+On-disk Parse Cache
+===================
+
+Stores parsed spaCy ``Doc`` objects as ``DocBin`` shards so that the same essays are
+not run through ``en_core_web_trf`` again on every run or by every script.
+
+Documents are keyed by a hash of their text. Shards are grouped by a pipeline
+fingerprint built from the pipeline name, its version, the spaCy version and the
+enabled components, so scripts that load the same pipeline share cached parses and
+a changed pipeline never returns stale annotations.
+
+Layout::
+
+    <cache_dir>/<fingerprint>/<shard>.spacy   serialized DocBin
+    <cache_dir>/<fingerprint>/<shard>.json    text hashes stored in the shard, in order
+
+The total size of all shards is bounded; the least recently used shards are evicted
+first.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import uuid
+
+from common.memory import memory_usage_mb, pipe_in_pieces
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'grammar-research-spacy', 'parses')
+DEFAULT_MAX_GB = 20.0
+
+
+def text_hash(text):
+    """Return the content hash used as cache key for a text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def pipeline_fingerprint(nlp):
+    """
+    Build a directory-safe identifier for a loaded pipeline.
+
+    Args:
+        nlp: Loaded spaCy Language object
+
+    Returns:
+        String combining the pipeline name, version and a hash of its configuration
+    """
+    import spacy
+
+    meta = nlp.meta
+    settings = {
+        'lang': nlp.lang,
+        'name': meta.get('name', ''),
+        'version': meta.get('version', ''),
+        'spacy_version': spacy.__version__,
+        # doc_cleaner only drops activations and does not change the stored annotations
+        'components': [name for name in nlp.pipe_names if name != 'doc_cleaner'],
+    }
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f"{nlp.lang}_{meta.get('name', 'pipeline')}-{meta.get('version', '0')}-{digest}"
+
+
+class ParseCache:
+    """
+    Size-bounded on-disk cache of parsed documents.
+
+    Use ``ParseCache.pipe`` as a drop-in replacement for ``nlp.pipe``; cached
+    documents are loaded from disk and only unseen texts are parsed.
+    """
+
+    def __init__(self, cache_dir=None, max_gb=None, shard_size=1000, enabled=True):
+        """
+        Args:
+            cache_dir: Cache directory (defaults to $PARSE_CACHE_DIR or ~/.cache/grammar-research-spacy/parses)
+            max_gb: Maximum total shard size in gigabytes (defaults to $PARSE_CACHE_MAX_GB or 20)
+            shard_size: Number of documents stored per shard
+            enabled: If False, pipe() simply forwards to nlp.pipe()
+        """
+        self.cache_dir = cache_dir or os.environ.get('PARSE_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = int(float(max_gb or os.environ.get('PARSE_CACHE_MAX_GB', DEFAULT_MAX_GB)) * 1024 ** 3)
+        self.shard_size = shard_size
+        self.enabled = enabled
+        self._indexes = {}
+        self._protected = set()  # shards written by the running pipe() call
+
+    def pipe(self, nlp, texts, as_tuples=False, max_chars=None, **pipe_kwargs):
+        """
+        Parse texts, reusing cached documents where available.
+
+        The input is consumed in blocks of shard_size texts: the unseen texts of a
+        block are parsed, written as one shard and the block is yielded in input order
+        before the next block is read, so memory stays flat however large the corpus
+        is. A single nlp.pipe stream is kept open across blocks, so multiprocessing
+        workers (n_process > 1) are started once per run. Shards written by this call
+        are never evicted while it runs. Memory use is logged after every written shard.
+
+        Args:
+            nlp: Loaded spaCy Language object
+            texts: Iterable of texts, or of (text, context) tuples if as_tuples is True
+            as_tuples: Whether texts contains (text, context) tuples
+            max_chars: Texts longer than this are parsed in pieces and merged (see common.memory)
+            **pipe_kwargs: Extra keyword arguments passed on to nlp.pipe (e.g. n_process, batch_size)
+
+        Yields:
+            Doc objects, or (Doc, context) tuples, in input order
+        """
+        if not self.enabled:
+            yield from pipe_in_pieces(nlp, texts, max_chars, as_tuples=as_tuples, **pipe_kwargs)
+            return
+
+        fingerprint = pipeline_fingerprint(nlp)
+        index = self._load_index(fingerprint)
+        items = iter(texts)
+        blocks = collections.deque()   # blocks read from the input, not yet yielded
+        to_parse = collections.deque()  # unseen texts queued for nlp.pipe, in block order
+        queued = set()                  # keys queued for parsing but not yet written to a shard
+        counts = {'cached': 0, 'parsed': 0}
+
+        def read_block():
+            """Read the next block of the input and queue its unseen texts; False at the end."""
+            block = list(itertools.islice(items, self.shard_size))
+            if not block:
+                return False
+            keys = [text_hash(item[0] if as_tuples else item) for item in block]
+            missing = []
+            for key, item in zip(keys, block):
+                # Parse each unseen text once, even if it occurs several times in the corpus
+                if key not in index and key not in queued:
+                    queued.add(key)
+                    missing.append(key)
+                    to_parse.append(item[0] if as_tuples else item)
+            blocks.append((block, keys, missing))
+            return True
+
+        def feed():
+            # nlp.pipe may read ahead of the block being yielded; it pulls further blocks as needed
+            while to_parse or read_block():
+                if to_parse:
+                    yield to_parse.popleft()
+
+        parsed = pipe_in_pieces(nlp, feed(), max_chars, **pipe_kwargs)
+        try:
+            while blocks or read_block():
+                block, keys, missing = blocks.popleft()
+                new_docs = {}
+                if missing:
+                    new_docs = {key: next(parsed) for key in missing}
+                    shard = self._write(fingerprint, index, new_docs)
+                    self._protected.add(shard)
+                    self.evict()
+                    queued.difference_update(missing)
+                    counts['parsed'] += len(missing)
+                    logger.info(f"Parsed {counts['parsed']} documents ({counts['cached']} cached), "
+                                f"memory {memory_usage_mb():.0f} MB")
+                counts['cached'] += len(block) - len(missing)
+
+                loaded = {}
+                for key, item in zip(keys, block):
+                    doc = new_docs.get(key)
+                    if doc is None:
+                        doc = self._get(fingerprint, index, key, nlp.vocab, loaded)
+                    if doc is None:
+                        # Evicted by another process: parse it again without caching
+                        logger.warning("Parse cache is smaller than the corpus; consider raising PARSE_CACHE_MAX_GB")
+                        doc = next(pipe_in_pieces(nlp, [item[0] if as_tuples else item], max_chars))
+                    if as_tuples:
+                        yield doc, item[1]
+                    else:
+                        yield doc
+        finally:
+            parsed.close()
+            self._protected.clear()
+        logger.info(f"Parse cache: {counts['cached']} cached, {counts['parsed']} parsed ({fingerprint})")
+
+    def _shard_dir(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint)
+
+    def _load_index(self, fingerprint):
+        """Build the text hash -> (shard, position) index from the shard key files."""
+        if fingerprint in self._indexes:
+            return self._indexes[fingerprint]
+
+        index = {}
+        shard_dir = self._shard_dir(fingerprint)
+        os.makedirs(shard_dir, exist_ok=True)
+        for entry in os.scandir(shard_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            shard = entry.name[:-len('.json')]
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    keys = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for position, key in enumerate(keys):
+                index[key] = (shard, position)
+
+        self._indexes[fingerprint] = index
+        return index
+
+    def _get(self, fingerprint, index, key, vocab, loaded):
+        """Return a cached document, keeping only the most recently loaded shard in memory."""
+        if key not in index:
+            return None
+        shard, position = index[key]
+        if shard not in loaded:
+            loaded.clear()
+            path = os.path.join(self._shard_dir(fingerprint), shard + '.spacy')
+            from spacy.tokens import DocBin
+            try:
+                loaded[shard] = list(DocBin().from_disk(path).get_docs(vocab))
+                # Mark the shard as recently used for eviction
+                os.utime(path)
+            except (OSError, ValueError):
+                # Evicted by another process or unreadable: forget it
+                for stale_key in [k for k, (s, _) in index.items() if s == shard]:
+                    del index[stale_key]
+                return None
+        return loaded[shard][position]
+
+    def _write(self, fingerprint, index, docs_by_key):
+        """Store newly parsed documents as a new shard and return its name."""
+        shard = uuid.uuid4().hex
+        shard_dir = self._shard_dir(fingerprint)
+        from spacy.tokens import DocBin
+        doc_bin = DocBin(store_user_data=False)
+        for doc in docs_by_key.values():
+            doc_bin.add(doc)
+        doc_bin.to_disk(os.path.join(shard_dir, shard + '.spacy'))
+
+        # Write the key file last so that a shard is only indexed once it is complete
+        keys = list(docs_by_key)
+        tmp_path = os.path.join(shard_dir, shard + '.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, os.path.join(shard_dir, shard + '.json'))
+
+        for position, key in enumerate(keys):
+            index[key] = (shard, position)
+        return shard
+
+    def evict(self):
+        """Remove least recently used shards until the cache fits in max_bytes, keeping those of the running pipe()."""
+        shards = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.spacy'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    shards.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+        for _, size, path in sorted(shards):
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(path)[:-len('.spacy')] in self._protected:
+                continue
+            for stale in (path[:-len('.spacy')] + '.json', path):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.info(f"Evicted parse cache shard {path}")
@@ -0,0 +1,231 @@
+"""
+Figure Rendering
+================
+
+Headless, parallel rendering of the figures of the analysis scripts.
+
+- Importing this module selects matplotlib's non-interactive Agg backend (unless
+  ``MPLBACKEND`` is set), so figures never open a window or block a batch job. Import
+  it before ``matplotlib.pyplot``. matplotlib itself is only imported when a figure is
+  rendered, so scripts can import this module at the top.
+- A figure is described by a ``FigureJob``: the output file, a module-level render
+  function and the precomputed summary table it draws. ``render_figures`` renders the
+  pending jobs in a pool of worker processes; each worker saves and closes its figure.
+- Every rendered file is recorded in ``.figure_hashes.json`` in its directory, with a
+  hash of the render function, its data and its options. A job whose file exists and
+  whose hash is unchanged is skipped.
+
+Settings can be overridden with environment variables:
+
+- ``FIGURES``: ``none`` skips all figures (fast path for pipeline runs)
+- ``FIGURE_WORKERS``: number of render processes
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from common.execution import start_method
+
+if not os.environ.get('MPLBACKEND'):
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+    else:
+        os.environ['MPLBACKEND'] = 'Agg'  # read by matplotlib when it is imported
+
+logger = logging.getLogger(__name__)
+
+HASH_FILE = '.figure_hashes.json'
+DEFAULT_DPI = 300
+# Libraries with thread pools or device contexts that a forked worker can deadlock on
+FORK_UNSAFE_MODULES = ('torch', 'jax', 'tensorflow')
+
+
+def figures_enabled():
+    """Return False if figures are switched off with FIGURES=none."""
+    return os.environ.get('FIGURES', 'all').lower() not in ('none', '0', 'off', 'false', 'no')
+
+
+def _update_hash(h, value):
+    """Feed a summary table (DataFrame, Series, array, xarray Dataset, or nested dict/list of them) into a hash."""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        h.update(repr((list(value.columns), [str(dtype) for dtype in value.dtypes])).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(repr((value.name, str(value.dtype))).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.shape, str(value.dtype))).encode('utf-8'))
+        if value.dtype == object:  # e.g. string coordinates; the raw bytes would be pointers
+            h.update(repr(value.tolist()).encode('utf-8'))
+        else:
+            h.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, 'data_vars') and hasattr(value, 'variables'):
+        # xarray Dataset (e.g. a posterior): data variables and coordinates with their labels
+        for name in sorted(value.variables, key=str):
+            variable = value.variables[name]
+            h.update(repr((name, variable.dims)).encode('utf-8'))
+            _update_hash(h, np.asarray(variable.values))
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            h.update(repr(key).encode('utf-8'))
+            _update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        h.update(f'{type(value).__name__}[{len(value)}]'.encode('utf-8'))
+        for item in value:
+            _update_hash(h, item)
+    else:
+        h.update(repr(value).encode('utf-8'))
+
+
+def _code_fingerprint(code):
+    """Bytecode and constants of a function, so that editing a render function re-renders its figure."""
+    parts = [code.co_code, repr(code.co_names).encode('utf-8')]
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            parts.append(_code_fingerprint(const))
+        else:
+            parts.append(repr(const).encode('utf-8'))
+    return b'|'.join(parts)
+
+
+class FigureJob:
+    """One figure: a render function, the summary data it draws and the file it is saved to."""
+
+    def __init__(self, path, render, data, dpi=DEFAULT_DPI, **options):
+        """
+        Args:
+            path: Output file; the format follows the extension (e.g. .png, .pdf)
+            render: Module-level function render(data, **options) drawing on a new pyplot figure
+            data: Summary table(s) passed to render (DataFrame, Series, array, xarray Dataset or a dict/list of them)
+            dpi: Resolution of the saved file
+            **options: Further keyword arguments for render (titles, labels, ...)
+        """
+        self.path = path
+        self.render = render
+        self.data = data
+        self.dpi = dpi
+        self.options = options
+
+    def digest(self):
+        """Hash of everything the rendered file depends on."""
+        h = hashlib.sha1()
+        h.update(f'{self.render.__module__}.{self.render.__qualname__}'.encode('utf-8'))
+        h.update(_code_fingerprint(self.render.__code__))
+        _update_hash(h, self.data)
+        _update_hash(h, self.options)
+        h.update(repr(self.dpi).encode('utf-8'))
+        return h.hexdigest()
+
+
+def _render(job):
+    """Worker: draw one figure, save it atomically and free it."""
+    import matplotlib.pyplot as plt
+
+    root, extension = os.path.splitext(job.path)
+    tmp_path = f'{root}.tmp{extension}'
+    try:
+        job.render(job.data, **job.options)
+        plt.savefig(tmp_path, dpi=job.dpi, bbox_inches='tight')
+        os.replace(tmp_path, job.path)
+    finally:
+        plt.close('all')
+    return job.path
+
+
+def _default_workers(n_jobs):
+    """
+    One process per figure up to the number of cores where workers are forked. With the
+    'spawn' start method (macOS, Windows) workers re-import the calling script, which
+    is unsafe for the top-level scripts in this repository, so figures are rendered in
+    the calling process unless FIGURE_WORKERS is set explicitly. The same applies when
+    torch, jax or tensorflow is loaded: forking a process that holds their thread pools
+    or a CUDA context can deadlock the workers.
+    """
+    if os.environ.get('FIGURE_WORKERS'):
+        return int(os.environ['FIGURE_WORKERS'])
+    if start_method() != 'fork':
+        return 1
+    if any(module in sys.modules for module in FORK_UNSAFE_MODULES):
+        return 1
+    return min(n_jobs, os.cpu_count() or 1)
+
+
+def _load_hashes(directory):
+    path = os.path.join(directory, HASH_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_hashes(directory, hashes):
+    path = os.path.join(directory, HASH_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def render_figures(jobs, workers=None, enabled=None, force=False):
+    """
+    Render the figures whose file is missing or whose inputs changed.
+
+    Args:
+        jobs: List of FigureJob
+        workers: Number of render processes (defaults to $FIGURE_WORKERS, or one per figure up to the number of cores)
+        enabled: Render at all (defaults to figures_enabled(), i.e. False with FIGURES=none)
+        force: Re-render every figure even if its inputs are unchanged
+
+    Returns:
+        List of the paths that were rendered
+    """
+    if enabled is None:
+        enabled = figures_enabled()
+    if not enabled:
+        logger.info(f"Figures disabled; skipping {len(jobs)} figures")
+        return []
+
+    hashes = {}
+    pending = []
+    for job in jobs:
+        directory = os.path.dirname(job.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        if directory not in hashes:
+            hashes[directory] = _load_hashes(directory)
+        digest = job.digest()
+        name = os.path.basename(job.path)
+        if force or not os.path.exists(job.path) or hashes[directory].get(name) != digest:
+            pending.append((job, directory, name, digest))
+
+    rendered = []
+    try:
+        if pending:
+            n_workers = max(1, min(workers or _default_workers(len(pending)), len(pending)))
+            pending_jobs = [job for job, _, _, _ in pending]
+            if n_workers > 1:
+                with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                    results = pool.map(_render, pending_jobs)
+                    for (job, directory, name, digest), path in zip(pending, results):
+                        hashes[directory][name] = digest
+                        rendered.append(path)
+            else:
+                for job, directory, name, digest in pending:
+                    rendered.append(_render(job))
+                    hashes[directory][name] = digest
+    finally:
+        # Record what was rendered even if a later figure failed
+        for directory in {directory for _, directory, _, _ in pending}:
+            _save_hashes(directory, hashes[directory])
+
+    logger.info(f"{len(rendered)} figures rendered, {len(jobs) - len(pending)} unchanged")
+    return rendered
@@ -1,178 +1,281 @@
 ### This is the code for my accepted paper titled 'Probabilistic Analysis of English Dative Constructions in Academic Writings of English EFL Learners' 
-(January 2024 - Theory and Practice of Second Language Acquisition))###
+### (January 2024 - Theory and Practice of Second Language Acquisition))###
 
-import pandas as pd
-import spacy
+import argparse
+import logging
+import itertools
 import math
-import re
+import os
+import sys
+from array import array
+
+# spaCy and the transformer model, numpy and pyarrow are imported by the stages that use
+# them, so that --help starts quickly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus import clean_icle_text, iter_corpus
+from common.execution import setup_execution
+from common.incremental import DOC_KEY, IncrementalManifest, merge_parquet
+from common.memory import add_activation_cleaner, memory_usage_mb
+from common.parse_cache import ParseCache
+
+logger = logging.getLogger(__name__)
 
 def load_data():
-    # Load metadata and text files, preprocess and return as list of tuples
+    # Lazily pair each cleaned text with its metadata, reading only the needed columns
     # Add your own file paths here
-    meta = pd.read_csv('F:/learner Corpora/metadata_with_text.csv')
-    text = pd.read_csv('F:/Learner Corpora/text_only.csv')
-    
-    text['text_field'] = text['text_field'].apply(lambda x: re.sub(pattern, '', x).replace('\n', ''))
-    meta_x = meta.to_dict('records')
-    text_only = text['text_field'].values.tolist()
-    icle = list(zip(text_only, meta_x))
-    
-    return icle
+    return iter_corpus('F:/learner Corpora/metadata_with_text.csv', text_column='text_field',
+                       text_path='F:/Learner Corpora/text_only.csv',
+                       context_columns=['docid_field', 'Native_language'],
+                       categorical_columns=['Native_language'], clean=clean_icle_text)
     
 def setup_spacy():
-    # Setup Spacy with required settings and return the instance
-    spacy.require_gpu()
-    pattern = r'ICLE\-\w+\-\w+\-\d+\.\d+'
+    # Setup Spacy with required settings and return the instance with its execution settings
+    import spacy
+    execution = setup_execution()
     nlp = spacy.load('en_core_web_trf')
     nlp.max_length = 150000000000000
     nlp.create_pipe('merge_noun_chunks')
     nlp.add_pipe('merge_noun_chunks')
+    # Drop transformer activations once the downstream components have used them
+    add_activation_cleaner(nlp)
     
-    return nlp
+    return nlp, execution
+
+RELATIVE_PRON_LIST = ['which', 'what', 'who', 'that', " "]
+POS_LIST = ['SPACE', 'X', 'SCON']
 
-def is_valid_token(token, relative_pron_list, pos_list):
+# How to combine several valid subjects/objects of the same verb:
+#   'product' - one row per combination (cartesian product, as in the published analysis)
+#   'first'   - only the first argument of each kind in token order
+#   'nearest' - only the argument of each kind closest to the verb (or to the preposition)
+ARGUMENT_POLICIES = ('product', 'first', 'nearest')
+
+# Bump when iter_datives changes its output so that incremental runs rebuild all results
+EXTRACTOR_VERSION = 2
+
+def is_valid_token(token, relative_pron_list=RELATIVE_PRON_LIST, pos_list=POS_LIST):
     return token.pos_ not in pos_list and token.lemma_ not in relative_pron_list
 
-def process_double_object_dative(docs_with_context):
-    # Process and extract information for double object dative constructions
-    
-    relative_pron_list = ['which', 'what', 'who', 'that', " "]
-    pos_list = ['SPACE', 'X', 'SCON']
-    
-    dative_sentences = []
-    native_language = []
-    doc_id = []
-    nsubj = []
-    nsubj_pos = []
-    root = []
-    dative = []
-    dative_pos = []
-    direct_obj = []
-    direct_obj_pos = []
-    length_dative = []
-    length_direct_obj = []
+DATIVE_COLUMNS = ['dative_sentences', 'native_language', 'doc_id', DOC_KEY, 'nsubj', 'nsubj_pos', 'root',
+                  'dative', 'dative_pos', 'direct_obj', 'direct_obj_pos', 'pre_obj', 'pre_obj_pos',
+                  'length_dative', 'length_direct_obj', 'construction_type']
+
+def index_children(token, deps):
+    # Group the valid children of a token by dependency label in one pass
+    children = {dep: [] for dep in deps}
+    for child in token.children:
+        if child.dep_ in children and is_valid_token(child):
+            children[child.dep_].append(child)
+    return children
+
+def check_policy(policy):
+    # Reject an unknown argument policy before any document is processed
+    if policy not in ARGUMENT_POLICIES:
+        raise ValueError(f"Unknown argument policy {policy!r}; expected one of {ARGUMENT_POLICIES}")
+
+def select_arguments(tokens, anchor, policy):
+    # Apply the (already validated) argument policy to the candidate subjects/objects of one construction
+    if policy == 'product' or len(tokens) <= 1:
+        return tokens
+    if policy == 'first':
+        return tokens[:1]
+    return [min(tokens, key=lambda tok: abs(tok.i - anchor.i))]  # 'nearest'
+
+def iter_datives(doc, context, policy='product'):
+    # Yield double object and prepositional dative rows from a single walk over the document.
+    # The nsubj/dobj children of each verb are indexed once and shared by all its datives.
+    # The policy is validated by the callers, once per run.
+    verb_children = {}
+
+    for d in doc:
+        if d.dep_ != "dative" or d.head.pos_ != "VERB" or not is_valid_token(d):
+            continue
+        verb = d.head
+        if verb.i not in verb_children:
+            verb_children[verb.i] = index_children(verb, ('nsubj', 'dobj'))
+        subjects = select_arguments(verb_children[verb.i]['nsubj'], verb, policy)
+        objects = select_arguments(verb_children[verb.i]['dobj'], verb, policy)
+        if not subjects or not objects:
+            continue
+
+        sent = d.sent
+        row = {
+            'sent_start': sent.start_char,
+            'sent_end': sent.end_char,
+            'native_language': context['Native_language'],
+            'doc_id': context['docid_field'],
+            DOC_KEY: context.get(DOC_KEY),
+            'root': verb.lemma_,
+            'dative': d.text,
+            'dative_pos': d.pos_,
+        }
+
+        if d.pos_ == "ADP":
+            pre_objects = select_arguments(index_children(d, ('pobj',))['pobj'], d, policy)
+            for n, x, p in itertools.product(subjects, objects, pre_objects):
+                yield dict(row,
+                           nsubj=n.text, nsubj_pos=n.pos_,
+                           direct_obj=x.text, direct_obj_pos=x.pos_,
+                           pre_obj=p.text, pre_obj_pos=p.pos_,
+                           length_dative=math.log10(len(p.text)),
+                           length_direct_obj=math.log10(len(x.text)),
+                           construction_type='prepositional')
+        else:
+            for n, x in itertools.product(subjects, objects):
+                yield dict(row,
+                           nsubj=n.text, nsubj_pos=n.pos_,
+                           direct_obj=x.text, direct_obj_pos=x.pos_,
+                           length_dative=math.log10(len(d.text)),
+                           length_direct_obj=math.log10(len(x.text)),
+                           construction_type='double_object')
+
+class DativeResults:
+    # Columnar accumulator for dative rows. Strings are interned into integer codes and each
+    # sentence is kept as character offsets into its document text, so a hit costs a few
+    # integers instead of a Span that pins its whole Doc. Sentence text is built on write.
+
+    STRING_COLUMNS = ['native_language', 'doc_id', DOC_KEY, 'nsubj', 'nsubj_pos', 'root', 'dative', 'dative_pos',
+                      'direct_obj', 'direct_obj_pos', 'pre_obj', 'pre_obj_pos', 'construction_type']
+    FLOAT_COLUMNS = ['length_dative', 'length_direct_obj']
+
+    @classmethod
+    def schema(cls):
+        # Parquet schema of the output; pyarrow is only imported once rows are written
+        import pyarrow as pa
+        return pa.schema([(column, pa.string()) if column == 'dative_sentences'
+                          else (column, pa.float64()) if column in cls.FLOAT_COLUMNS
+                          else (column, pa.dictionary(pa.int32(), pa.string()))
+                          for column in DATIVE_COLUMNS])
 
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.strings = {}
+        self.codes = {column: array('i') for column in self.STRING_COLUMNS}
+        self.floats = {column: array('d') for column in self.FLOAT_COLUMNS}
+        self.sent_doc = array('i')
+        self.sent_start = array('i')
+        self.sent_end = array('i')
+        self.doc_texts = []
+        self._last_doc = None
+
+    def __len__(self):
+        return len(self.sent_doc)
+
+    def add(self, doc, row):
+        # Keep only the text of documents that produced rows
+        if doc is not self._last_doc:
+            self.doc_texts.append(doc.text)
+            self._last_doc = doc
+        self.sent_doc.append(len(self.doc_texts) - 1)
+        self.sent_start.append(row['sent_start'])
+        self.sent_end.append(row['sent_end'])
+        for column in self.STRING_COLUMNS:
+            value = row.get(column)
+            if value is None or value != value:  # missing or NaN
+                self.codes[column].append(-1)
+            else:
+                self.codes[column].append(self.strings.setdefault(str(value), len(self.strings)))
+        for column in self.FLOAT_COLUMNS:
+            self.floats[column].append(row[column])
+
+    def to_table(self):
+        import numpy as np
+        import pyarrow as pa
+        dictionary = pa.array(list(self.strings), type=pa.string())
+        sentences = [self.doc_texts[d][start:end]
+                     for d, start, end in zip(self.sent_doc, self.sent_start, self.sent_end)]
+        columns = {'dative_sentences': pa.array(sentences, type=pa.string())}
+        for column in self.STRING_COLUMNS:
+            codes = np.frombuffer(self.codes[column], dtype=np.int32)
+            indices = pa.array(codes, type=pa.int32(), mask=codes < 0)
+            columns[column] = pa.DictionaryArray.from_arrays(indices, dictionary)
+        for column in self.FLOAT_COLUMNS:
+            columns[column] = pa.array(np.frombuffer(self.floats[column], dtype=np.float64))
+        return pa.table([columns[column] for column in DATIVE_COLUMNS], schema=self.schema())
+
+    def to_frame(self, columns=DATIVE_COLUMNS):
+        return self.to_table().to_pandas()[columns]
+
+    def write(self, writer):
+        # Write the accumulated rows as one Parquet row group and start a new chunk
+        n_rows = len(self)
+        if n_rows:
+            writer.write_table(self.to_table())
+        self.clear()
+        return n_rows
+
+def process_double_object_dative(docs_with_context, policy='product'):
+    # Process and extract information for double object dative constructions
+    check_policy(policy)
+    results = DativeResults()
     for doc, context in docs_with_context:
-        doc._.trf_data = None
-        for d in doc:
-            if d.dep_ == "dative" and d.pos_ != 'ADP' and d.head.pos_ == "VERB" and is_valid_token(d, relative_pron_list, pos_list):
-                for n in d.head.children:
-                    if n.dep_ == "nsubj" and is_valid_token(n, relative_pron_list, pos_list):
-                        for x in d.head.children:
-                            if x.dep_ == "dobj" and is_valid_token(x, relative_pron_list, pos_list):
-
-                                dative.append(d.text)
-                                dative_pos.append(d.pos_)
-                                length_dative.append(math.log10(len(d.text)))
-                                root.append(d.head.lemma_)
-                                nsubj.append(n.text)
-                                nsubj_pos.append(n.pos_)
-                                direct_obj.append(x.text)
-                                direct_obj_pos.append(x.pos_)
-                                length_direct_obj.append(math.log10(len(x.text)))
-                                dative_sentences.append(d.sent)
-                                native_language.append(context['Native_language'])
-                                doc_id.append(context['docid_field'])
-
-    results = pd.DataFrame({
-        'dative_sentences': dative_sentences,
-        'native_language': native_language,
-        'doc_id': doc_id,
-        'nsubj': nsubj,
-        'nsubj_pos': nsubj_pos,
-        'root': root,
-        'dative': dative,
-        'dative_pos': dative_pos,
-        'direct_obj': direct_obj,
-        'direct_obj_pos': direct_obj_pos,
-        'length_dative': length_dative,
-        'length_direct_obj': length_direct_obj,
-        'construction_type': 'double_object'
-    })
-    return results
-
-def process_prepositional_dative(docs_with_context):
-    # Process and extract information for prepositional dative constructions
-    
-    relative_pron_list = ['which', 'what', 'who', 'that', " "]
-    pos_list = ['SPACE', 'X', 'SCON']
-    
-    dative_sentences_pre = []
-    native_language_pre = []
-    doc_id_pre = []
-    nsubj_pre = []
-    nsubj_pre_pos = []
-    root_pre = []
-    dative_pre = []
-    dative_pre_pos = []
-    direct_obj_pre = []
-    direct_obj_pre_pos = []
-    pre_obj = []
-    pre_obj_pos = []
-    length_pre_obj = []
-    length_pre_direct_obj = []
+        for row in iter_datives(doc, context, policy):
+            if row['construction_type'] == 'double_object':
+                results.add(doc, row)
+
+    return results.to_frame([col for col in DATIVE_COLUMNS if col not in ('pre_obj', 'pre_obj_pos')])
 
+def process_prepositional_dative(docs_with_context, policy='product'):
+    # Process and extract information for prepositional dative constructions
+    check_policy(policy)
+    results = DativeResults()
     for doc, context in docs_with_context:
-        doc._.trf_data = None
-        for b in doc:
-            if b.dep_ == "dative" and b.pos_ == "ADP" and b.head.pos_ == "VERB" and is_valid_token(b, relative_pron_list, pos_list):
-                for m in b.head.children:
-                    if m.dep_ == "nsubj" and is_valid_token(m, relative_pron_list, pos_list):
-                        for k in b.head.children:
-                            if k.dep_ == "dobj" and is_valid_token(k, relative_pron_list, pos_list):
-                                for l in b.children:
-                                    if l.dep_ == "pobj" and is_valid_token(l, relative_pron_list, pos_list):
-                                        
-                                        dative_sentences_pre.append(b.sent)
-                                        native_language_pre.append(context['Native_language'])
-                                        doc_id_pre.append(context['docid_field'])
-                                        nsubj_pre.append(m.text)
-                                        nsubj_pre_pos.append(m.pos_)
-                                        root_pre.append(b.head.lemma_)
-                                        dative_pre.append(b.text)
-                                        dative_pre_pos.append(b.pos_)
-                                        direct_obj_pre.append(k.text)
-                                        direct_obj_pre_pos.append(k.pos_)
-                                        length_pre_direct_obj.append(math.log10(len(k.text)))
-                                        pre_obj.append(l.text)
-                                        pre_obj_pos.append(l.pos_)
-                                        length_pre_obj.append(math.log10(len(l.text)))
-
-    results = pd.DataFrame({
-        'dative_sentences': dative_sentences_pre,
-        'native_language': native_language_pre,
-        'doc_id': doc_id_pre,
-        'nsubj': nsubj_pre,
-        'nsubj_pos': nsubj_pre_pos,
-        'root': root_pre,
-        'dative': dative_pre,
-        'dative_pos': dative_pre_pos,
-        'direct_obj': direct_obj_pre,
-        'direct_obj_pos': direct_obj_pre_pos,
-        'pre_obj': pre_obj,
-        'pre_obj_pos': pre_obj_pos,
-        'length_dative': length_pre_obj,
-        'length_direct_obj': length_pre_direct_obj,
-        'construction_type': 'prepositional'
-    })
-
-    return results
-
-
-def main():
-    icle_data = load_data()
-    nlp = setup_spacy()
-    docs_with_context = list(nlp.pipe(icle_data, as_tuples=True))
+        for row in iter_datives(doc, context, policy):
+            if row['construction_type'] == 'prepositional':
+                results.add(doc, row)
+
+    return results.to_frame()
+
+def stream_datives(docs_with_context, output_path, chunk_size=10000, policy='product'):
+    # Extract both constructions in one walk per (doc, context) pair and write a Parquet row group
+    # every chunk_size rows, so only one Doc and one compact chunk are held in memory
+    import pyarrow.parquet as pq
+    check_policy(policy)
+    results = DativeResults()
+    total = 0
+    with pq.ParquetWriter(output_path, DativeResults.schema()) as writer:
+        for doc, context in docs_with_context:
+            for row in iter_datives(doc, context, policy):
+                results.add(doc, row)
+            if len(results) >= chunk_size:
+                total += results.write(writer)
+                logger.info(f"{total} rows written, memory {memory_usage_mb():.0f} MB")
+
+        total += results.write(writer)
+    return total
+
+
+def stream_datives_incremental(docs_with_context, manifest, output_path, chunk_size=10000, policy='product'):
+    # Extract datives of the new or changed documents only, then merge them into the previous
+    # results: rows of changed or deleted documents (by their manifest key, doc_key) are dropped on the way
+    new_path = output_path + '.new'
+    stream_datives(docs_with_context, new_path, chunk_size, policy)
+    n_rows = merge_parquet(output_path, new_path, manifest)
+    manifest.save()
+    return n_rows
+
+def main(full=False, policy='product'):
+    nlp, execution = setup_spacy()
+    output_path = 'dative_results.parquet'
     
-    results_double_object_dative = process_double_object_dative(docs_with_context)
-    results_prepositional_dative = process_prepositional_dative(docs_with_context)
+    # Only documents that are new or changed since the last run are parsed and extracted
+    manifest = IncrementalManifest(output_path, f"{EXTRACTOR_VERSION}:{policy}", id_column='docid_field', full=full)
+    icle_data = manifest.select(load_data())
     
-    # Combine the DataFrames
-    combined_results = pd.concat([results_double_object_dative, results_prepositional_dative], ignore_index=True)
+    # Stream parsed documents straight into the extractors instead of keeping every Doc in memory
+    docs_with_context = ParseCache().pipe(nlp, icle_data, as_tuples=True, **execution.pipe_kwargs())
+    n_rows = stream_datives_incremental(docs_with_context, manifest, output_path, policy=policy)
     
-    # Save, analyze or display the combined DataFrame as needed
-    print(combined_results)
+    # Load with pd.read_parquet('dative_results.parquet') to analyze or display the combined results
+    print(f"{n_rows} dative constructions saved to {output_path}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Extract English dative constructions from a learner corpus')
+    parser.add_argument('--full', action='store_true', help='re-process the whole corpus instead of only new or changed documents')
+    parser.add_argument('--policy', choices=ARGUMENT_POLICIES, default='product', help='how to combine several subjects/objects of one verb')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(full=args.full, policy=args.policy)
 
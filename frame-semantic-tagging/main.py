@@ -1,19 +1,21 @@
-from frame_semantic_transformer import FrameSemanticTransformer
-frame_transformer = FrameSemanticTransformer()
-import torch
-torch.device("mps")
+import os
+import sys
 import pandas as pd
 import spacy
-nlp = spacy.load("en_core_web_trf")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.execution import setup_execution
+from common.memory import add_activation_cleaner
+from common.parse_cache import ParseCache, text_hash
+execution = setup_execution()
+# Only the tagger and lemmatizer are needed to locate the target lemma
+nlp = add_activation_cleaner(spacy.load("en_core_web_trf", disable=['parser', 'ner']))
+parse_cache = ParseCache()  # Parsed sentences are cached on disk and reused across runs and scripts
 
 df = pd.read_csv('your_data_file.csv')  # Replace with your actual data file path
 
 ### you dataframe is supposed have columns including 'sent' and 'lemma' ### 
 
-def find_lemma_index(sentence, lemma):
-    # Process the sentence with spaCy
-    doc = nlp(sentence)
-    
+def find_lemma_index(doc, lemma):
     # Iterate through the tokens and find the index of the lemma
     for token in doc:
         if token.lemma_ == lemma:
@@ -25,37 +27,97 @@ def find_lemma_index(sentence, lemma):
 sentences = df['sent'].tolist()
 lemmas = df['lemma'].tolist()
 
-# Create a list of sentences to analyze
-bulk_sentences = sentences
+# Import json to serialize the frame elements
+import json
+
+def iter_stored_frames(store_dir):
+    # Yield the frame records saved by detect_frames_chunked, one per detected frame
+    if not os.path.isdir(store_dir):
+        return
+    for name in sorted(os.listdir(store_dir)):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(store_dir, name), encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+_frame_transformer = None
+
+def load_frame_transformer():
+    # Load the frame_transformer model on first use, so a rerun with every sentence already
+    # stored in frame_chunks never loads it
+    global _frame_transformer
+    if _frame_transformer is None:
+        from frame_semantic_transformer import FrameSemanticTransformer
+        _frame_transformer = FrameSemanticTransformer()
+    return _frame_transformer
+
+def detect_frames_chunked(sentences, store_dir='frame_chunks', chunk_size=1000):
+    # Run the frame_transformer over the distinct sentences in chunks and save each completed
+    # chunk to store_dir, so that a restarted job skips the sentences already processed
+    os.makedirs(store_dir, exist_ok=True)
+    done = {record['sent_hash'] for record in iter_stored_frames(store_dir)}
+    pending = [sentence for sentence in dict.fromkeys(sentences) if text_hash(sentence) not in done]
+    n_stored = len([name for name in os.listdir(store_dir) if name.endswith('.jsonl')])
+    print(f"{len(pending)} distinct sentences left for frame detection")
+
+    for chunk, start in enumerate(range(0, len(pending), chunk_size), start=n_stored):
+        batch = pending[start:start + chunk_size]
+        results = load_frame_transformer().detect_frames_bulk(batch)
+
+        chunk_path = os.path.join(store_dir, f'chunk_{chunk:05d}.jsonl')
+        with open(chunk_path + '.tmp', 'w', encoding='utf-8') as f:
+            for sentence, result in zip(batch, results):
+                records = [{'sent_hash': text_hash(sentence),
+                            'trigger_location': frame.trigger_location,
+                            'frame': frame.name,
+                            'frame_elements': {element.name: element.text for element in frame.frame_elements}}
+                           for frame in result.frames]
+                if not records:
+                    # Record sentences without frames too, so they are not run again
+                    records = [{'sent_hash': text_hash(sentence), 'trigger_location': None,
+                                'frame': None, 'frame_elements': {}}]
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+        os.replace(chunk_path + '.tmp', chunk_path)
 
 # Analyze the sentences with the frame_transformer
-results = frame_transformer.detect_frames_bulk(bulk_sentences)
+detect_frames_chunked(sentences)
 
-# Import json to serialize the frame elements
-import json
+# Find the character offset of each distinct (sentence, lemma) pair in one batched pass
+pairs = list(dict.fromkeys(zip(sentences, lemmas)))
+unique_sentences = list(dict.fromkeys(sentence for sentence, _ in pairs))
+lemmas_per_sentence = {}
+for sentence, lemma in pairs:
+    lemmas_per_sentence.setdefault(sentence, []).append(lemma)
 
-# Create a new column for frame elements
-df['frame_elements'] = None
+lemma_offsets = {}
+for sentence, doc in zip(unique_sentences, parse_cache.pipe(nlp, unique_sentences, **execution.pipe_kwargs())):
+    for lemma in lemmas_per_sentence[sentence]:
+        lemma_offsets[(sentence, lemma)] = find_lemma_index(doc, lemma)
 
-# Iterate through the results
-for index, result in enumerate(results):
-    lemma = lemmas[index]
-    lemma_index = find_lemma_index(sentences[index], lemma)
+# Target lemma offsets of the rows of df
+targets = pd.DataFrame({
+    'row': range(len(df)),
+    'sent_hash': [text_hash(sentence) for sentence in sentences],
+    'trigger_location': [lemma_offsets[pair] for pair in zip(sentences, lemmas)]
+})
+target_keys = set(zip(targets['sent_hash'], targets['trigger_location']))
 
-    frames_for_lemma = []
-    frame_elements_for_lemma = {}
+# Stream the stored frames and keep only those triggered by a target lemma, so the frame store
+# (which may hold frames of many more sentences) is never loaded as a whole
+frame_rows = [(record['sent_hash'], record['trigger_location'], record['frame'], record['frame_elements'])
+              for record in iter_stored_frames('frame_chunks')
+              if record['frame'] is not None and (record['sent_hash'], record['trigger_location']) in target_keys]
+frames_df = pd.DataFrame(frame_rows, columns=['sent_hash', 'trigger_location', 'frame', 'frame_elements']).astype(
+    {'trigger_location': 'int64'})
 
-    # Iterate through the frames in the result
-    for frame in result.frames:
-        if lemma_index == frame.trigger_location:
-            frames_for_lemma.append(frame.name)
-            # Iterate through the frame elements for the matching frame
-            for element in frame.frame_elements:
-                frame_elements_for_lemma[element.name] = element.text
+# Join the frames to the target rows
+matched = targets.merge(frames_df, on=['sent_hash', 'trigger_location'], how='inner').groupby('row')
 
-    # Serialize frame elements as JSON
-    frame_elements_str = json.dumps(frame_elements_for_lemma)
+frames_for_lemma = matched['frame'].agg(', '.join)
+frame_elements_for_lemma = matched['frame_elements'].agg(
+    lambda elements: json.dumps({name: text for element in elements for name, text in element.items()}))
 
-    # Add frames and frame elements to the DataFrame
-    df.at[index, 'frames'] = ', '.join(frames_for_lemma)
-    df.at[index, 'frame_elements'] = frame_elements_str
+# Add frames and frame elements (serialized as JSON) to the DataFrame
+df['frames'] = frames_for_lemma.reindex(range(len(df)), fill_value='').values
+df['frame_elements'] = frame_elements_for_lemma.reindex(range(len(df)), fill_value='{}').values
@@ -1,44 +1,110 @@
+import hashlib
+import json
+import os
+import sys
 import spacy
 import lftk
-import torch
-torch.device("mps")
-spacy.require_gpu()
-nlp = spacy.load('en_core_web_trf', disable=['ner', 'textcat'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.execution import setup_execution
+from common.memory import add_activation_cleaner
+from common.parse_cache import ParseCache, text_hash
+from feature_store import FeatureStore
+execution = setup_execution()
+nlp = add_activation_cleaner(spacy.load('en_core_web_trf', disable=['ner', 'textcat']))
 from thinc.api import get_current_ops
 get_current_ops()
+import numpy as np
 import pandas as pd
+parse_cache = ParseCache()  # Parsed documents are cached on disk and reused across runs and scripts
 df = pd.read_csv('sample_data.csv')  # EFCAMDAT corpus is available upon request here "https://ef-lab.mmll.cam.ac.uk/EFCAMDAT.html"
 
-# 1. Create a function to process a single text and return the extracted features.
-def process_text(text):
-    doc = nlp(text)
-    LFTK = lftk.Extractor(docs=doc)
-    searched_features = lftk.search_features(domain="lexico-semantics", return_format="list_key")
+# 1. Resolve the feature list once and create a function that extracts it from a single parsed text.
+searched_features = lftk.search_features(domain="lexico-semantics", return_format="list_key")
 
-    
+def process_text(doc):
+    LFTK = lftk.Extractor(docs=doc)
     extracted_features = LFTK.extract(features=searched_features)
     
-    # Convert the dictionary to a DataFrame and transpose it to have one row per text
-    extracted_features_df = pd.DataFrame([extracted_features])
-    
-    return extracted_features_df
-# 2. Use the `apply` method to apply this function to the column containing the texts in your DataFrame.
-df['extracted_features'] = df['text_corrected'].astype(str).apply(process_text)
+    # Return the features as one row, in the order of searched_features
+    return [extracted_features[feature] for feature in searched_features]
+
+# 2. Extract the features chunk by chunk. Each completed chunk is saved to disk so that an
+# interrupted run resumes from the last completed chunk instead of starting over. Chunk files
+# are named after the hash of their texts, so essays appended to the corpus only add new chunks
+# (and redo the last partial one) while a changed chunk is never reused.
+chunk_size = 5000
+chunk_dir = 'feature_chunks'
+texts = df['text_corrected'].astype(str).tolist()
+n_chunks = (len(texts) + chunk_size - 1) // chunk_size
+
+manifest = {'chunk_size': chunk_size, 'features': searched_features}
+manifest_path = os.path.join(chunk_dir, 'manifest.json')
+os.makedirs(chunk_dir, exist_ok=True)
+if os.path.exists(manifest_path):
+    with open(manifest_path) as f:
+        if json.load(f) != manifest:
+            # The chunk size or the feature list changed: earlier chunks cannot be reused
+            for name in os.listdir(chunk_dir):
+                os.remove(os.path.join(chunk_dir, name))
+with open(manifest_path, 'w') as f:
+    json.dump(manifest, f)
+
+chunk_paths = [os.path.join(chunk_dir, f'chunk_{chunk:05d}_{text_hash(chr(0).join(texts[chunk * chunk_size:(chunk + 1) * chunk_size]))[:12]}.npy')
+               for chunk in range(n_chunks)]
+for name in set(os.listdir(chunk_dir)) - {os.path.basename(path) for path in chunk_paths} - {'manifest.json'}:
+    os.remove(os.path.join(chunk_dir, name))  # chunks of texts that are no longer in the corpus
+
+def chunk_path(chunk):
+    return chunk_paths[chunk]
+
+pending_chunks = [chunk for chunk in range(n_chunks) if not os.path.exists(chunk_path(chunk))]
+print(f"{n_chunks - len(pending_chunks)} of {n_chunks} chunks already extracted")
+
+# Parse all pending texts in one batched stream and cut the output back into chunks
+pending_texts = (text for chunk in pending_chunks for text in texts[chunk * chunk_size:(chunk + 1) * chunk_size])
+docs = parse_cache.pipe(nlp, pending_texts, **execution.pipe_kwargs())
+for chunk in pending_chunks:
+    n_rows = min(chunk_size, len(texts) - chunk * chunk_size)
+    chunk_features = np.empty((n_rows, len(searched_features)), dtype=np.float64)
+    for row, doc in zip(range(n_rows), docs):
+        chunk_features[row] = process_text(doc)
+    with open(chunk_path(chunk) + '.tmp', 'wb') as f:
+        np.save(f, chunk_features)
+    os.replace(chunk_path(chunk) + '.tmp', chunk_path(chunk))
 
-# 3. Combine the extracted features from each row into a new DataFrame.
-extracted_features_df = pd.concat(df['extracted_features'].tolist()).reset_index(drop=True)
+# 3. Fill the extracted features from each chunk into one preallocated matrix.
+features = np.empty((len(texts), len(searched_features)), dtype=np.float64)
+for chunk in range(n_chunks):
+    features[chunk * chunk_size:(chunk + 1) * chunk_size] = np.load(chunk_path(chunk))
 
-# Merge the original DataFrame with the extracted features DataFrame
-df.reset_index(drop=True, inplace=True)
-extracted_features_df.reset_index(drop=True, inplace=True)
+# 4. Save the metadata and features to the columnar feature store read by the later scripts.
+# l1 and cefr are encoded once here. Essays appended to the corpus are added as a new part;
+# the store is only rebuilt if earlier rows (texts or metadata), the metadata columns or the
+# feature list changed.
+def source_hash(texts, metadata):
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode('utf-8') + b'\0')
+    digest.update(pd.util.hash_pandas_object(metadata, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
 
-df = pd.concat([df, extracted_features_df], axis=1)
+metadata = df.drop(columns=['text_corrected']).reset_index(drop=True)
+store = FeatureStore()
+stored_rows = store.n_rows
+if not (store.features == searched_features and stored_rows <= len(df)
+        and store.metadata_columns in ([], list(metadata.columns))
+        and store.source_hash == source_hash(texts[:stored_rows], metadata.iloc[:stored_rows])):
+    store.create(searched_features)
+    stored_rows = 0
+store.append(metadata.iloc[stored_rows:], features[stored_rows:], source_hash=source_hash(texts, metadata))
 
-# You can now use extracted_features_df or merged_df to analyze the extracted features.
 print("Feature extraction completed!")
-print(f"Total features extracted: {len(extracted_features_df.columns)}")
-print(f"Dataset shape: {df.shape}")
+print(f"Total features extracted: {len(searched_features)}")
+print(f"Dataset shape: {(len(df), metadata.shape[1] + len(searched_features))}")
+print(f"{len(df) - stored_rows} rows added to the feature store '{store.path}' ({store.n_rows} rows)")
 
-# Save the results
-df.to_csv('extracted_lexical_features.csv', index=False)
-print("Results saved to 'extracted_lexical_features.csv'")
+# Export to CSV only if needed elsewhere; the analysis scripts read the feature store
+EXPORT_CSV = False
+if EXPORT_CSV:
+    store.read().to_csv('extracted_lexical_features.csv', index=False)
+    print("Results saved to 'extracted_lexical_features.csv'")
@@ -1,54 +1,27 @@
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LogisticRegressionCV
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 import numpy as np
+from feature_store import FeatureStore
+from regularization_path import fit_regularization_path, save_model
 
-df = pd.read_csv('extracted_lexical_features.csv')  # Import raw lexical complexity results
+# Load the data: only the lexical complexity features, l1 and cefr are read from the feature store
+store = FeatureStore()
+data = store.read(store.features + ['l1', 'cefr'])
 
-df = df.drop(['X', 'topic_id_original_categorical', 'cefr_numeric','grade','learner_id', 'topic_id_categorical'],axis=1)
-
-
-# Load the data
-data = df
-
-# Dummy code the categorical columns
-data_dummies = pd.get_dummies(data, columns=['l1'], drop_first=True)
+# Dummy code the categorical columns (from the l1 codes stored by 01_feature_extraction.py)
+data_dummies = store.dummies(data, columns=['l1'], drop_first=True)
 
 # Features and target
 X = data_dummies.drop(columns=['cefr'])  # Excluding only the target column
 y = data['cefr']
 
-# Preprocessing: Scaling all predictor columns
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('scale', StandardScaler(), X.columns)
-    ],
-    remainder='passthrough'
-)
-
-# Logistic Regression with L1 regularization (LASSO) for multi-class classification using cross-validation
-lasso_classifier_multi_cv = LogisticRegressionCV(
-    penalty='l1', 
-    solver='saga', 
-    max_iter=5000, 
-    multi_class='multinomial', 
-    random_state=42, 
-    cv=5  # Using 5-fold cross-validation; you can adjust this
-)
-
-# Creating and evaluating the pipeline for classification with multi-class target
-pipeline_classification_multi_cv = Pipeline([
-    ('preprocessor', preprocessor),
-    ('classifier', lasso_classifier_multi_cv)
-])
-
-# Fit the model
-pipeline_classification_multi_cv.fit(X, y)
+# Logistic Regression with L1 regularization (LASSO) for multi-class classification using cross-validation.
+# The 5 folds run in parallel, each walking the C grid with warm starts on cached, scaled fold matrices;
+# the model refitted at the best C is saved to lasso_model.joblib for 03_lasso_l1_analysis.py
+lasso_path = fit_regularization_path(X, y, cv=5)  # Using 5-fold cross-validation; you can adjust this
+save_model(lasso_path)
 
-# Extract the best C value
-best_C = lasso_classifier_multi_cv.C_
+# Extract the best C value (one shared value for all classes of the multinomial model)
+best_C = np.full(len(lasso_path['classes']), lasso_path['C'])
 
 print("Best C values for each class:", best_C)
 
@@ -58,7 +31,7 @@ print("Corresponding alpha values:", alpha_values)
 
 # Save the results
 results = pd.DataFrame({
-    'class': y.unique(),
+    'class': lasso_path['classes'],
     'best_C': best_C,
     'alpha_values': alpha_values
 })
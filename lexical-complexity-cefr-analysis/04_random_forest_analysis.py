@@ -3,19 +3,26 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.impute import SimpleImputer
+import os
+import sys
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.rendering import FigureJob, render_figures  # selects the headless Agg backend
+import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.impute import KNNImputer
+from feature_store import FeatureStore
+from forest_runner import ForestJob, run_forest_jobs
 
-df = pd.read_csv('extracted_lexical_features.csv')  # Import LASSO Results
 combined_std_lasso_results = pd.read_csv('standardized_lasso_results.csv')  # Import Standardized Top Ten LASSO Scores
 
-#Filter DataFrame to include Top Ten features per CEFR
+#Filter DataFrame to include Top Ten features per CEFR; only these columns are read from the feature store
 
+store = FeatureStore()
 selected_features = combined_std_lasso_results['Unnamed: 0'].unique()
-existing_features = [feature for feature in selected_features if feature in df.columns]
+existing_features = [feature for feature in selected_features if feature in store.features]
+df = store.read(['cefr_numeric', 'l1', 'cefr'] + existing_features)
 filtered_df = df[['cefr_numeric'] + existing_features]
 
 #Since Random Forest is not happy with NaN values, you need to impute
@@ -33,9 +40,23 @@ y = data_imputed['cefr_numeric']
 # Splitting the data into training and testing sets (80% training, 20% testing)
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Creating and training the Random Forest classifier with a reduced number of estimators (50)
-rf_classifier = RandomForestClassifier(n_estimators=50, random_state=42)
-rf_classifier.fit(X_train, y_train)
+# Data for the per-L1 models (raw scores, imputed per L1 inside each fit)
+l1_filtered_df = df[['cefr_numeric', 'l1', 'cefr'] + existing_features]
+l1_features = [feature for feature in l1_filtered_df.columns if feature not in ('l1', 'cefr', 'cefr_numeric')]
+
+# All Random Forest fits of this script are independent, so they are trained together on a process pool:
+# - the multi-class model with a reduced number of estimators (50)
+# - one-vs-rest models per CEFR level (same 80/20 split; the split does not depend on the target)
+# - one model per first language with at least 10 texts (100 estimators, mean imputation)
+cefr_levels = sorted(y.unique())
+l1_groups = {l1: l1_data for l1, l1_data in l1_filtered_df.groupby('l1', sort=False, observed=True) if len(l1_data) >= 10}
+jobs = [ForestJob('multiclass', X_train, y_train, n_estimators=50)]
+jobs += [ForestJob(('cefr', cefr_level), X_train, (y_train == cefr_level).astype(int), n_estimators=50)
+         for cefr_level in cefr_levels]
+jobs += [ForestJob(('l1', l1), l1_data[l1_features], l1_data['cefr_numeric'], n_estimators=100, impute=True)
+         for l1, l1_data in l1_groups.items()]
+importances, models, fit_timings = run_forest_jobs(jobs)
+rf_classifier = models['multiclass']
 
 # Predicting the target variable on the testing set
 y_pred = rf_classifier.predict(X_test)
@@ -63,43 +84,23 @@ feature_importances_df['NormalizedImportance'] = scaler.fit_transform(feature_im
 # Sort the DataFrame to get the top 10 most important features
 top_10_features = feature_importances_df.nlargest(10, 'NormalizedImportance')
 
-# Visualize the top 10 feature importances
-plt.figure(figsize=(10, 6))
-plt.barh(top_10_features['Feature'], top_10_features['NormalizedImportance'], color='lightsteelblue')
-plt.xlabel('Normalized Feature Importance')
-plt.ylabel('Feature')
-plt.title('Random Forest Top 10 Normalized Feature Importances')
-plt.gca().invert_yaxis()  # Invert the y-axis to have the most important features on top
-plt.show()
-
-# Initialize an empty DataFrame to store the feature importances for each CEFR level
-all_features_df = pd.DataFrame(columns=['CEFR_Level', 'Feature', 'Importance'])
-
-# Loop through each unique CEFR level
-for cefr_level in sorted(y.unique()):
-    # Create binary target variable for the specific CEFR level
-    y_binary = (y == cefr_level).astype(int)
-
-    # Split data into training and testing sets
-    X_train, X_test, y_train_binary, y_test_binary = train_test_split(X, y_binary, test_size=0.2, random_state=42)
-
-    # Create and train Random Forest classifier
-    rf_classifier_binary = RandomForestClassifier(n_estimators=50, random_state=42)
-    rf_classifier_binary.fit(X_train, y_train_binary)
-
-    # Extract and normalize feature importances
-    feature_importances_binary = rf_classifier_binary.feature_importances_
-    normalized_importances = feature_importances_binary / feature_importances_binary.sum()
-
-    # Create DataFrame for features for this CEFR level
-    cefr_features = pd.DataFrame({
-        'CEFR_Level': [cefr_level] * len(X.columns),
-        'Feature': X.columns,
-        'Importance': normalized_importances
-    })
-
-    # Append to main DataFrame
-    all_features_df = pd.concat([all_features_df, cefr_features], ignore_index=True)
+# Visualize the top 10 feature importances (rendered with the other figures at the end)
+def plot_top_features(top_10_features):
+    plt.figure(figsize=(10, 6))
+    plt.barh(top_10_features['Feature'], top_10_features['NormalizedImportance'], color='lightsteelblue')
+    plt.xlabel('Normalized Feature Importance')
+    plt.ylabel('Feature')
+    plt.title('Random Forest Top 10 Normalized Feature Importances')
+    plt.gca().invert_yaxis()  # Invert the y-axis to have the most important features on top
+
+# Feature importances of the one-vs-rest models (rows 1..n_levels of the importance array), normalized per CEFR level
+cefr_importances = importances[1:1 + len(cefr_levels)]
+cefr_importances = cefr_importances / cefr_importances.sum(axis=1, keepdims=True)
+all_features_df = pd.DataFrame({
+    'CEFR_Level': np.repeat(cefr_levels, len(X.columns)),
+    'Feature': np.tile(X.columns, len(cefr_levels)),
+    'Importance': cefr_importances.ravel()
+})
 
 
 # Create a mapping from numerical CEFR levels to string representation
@@ -111,75 +112,44 @@ cefr_mapping = {
     5.0: 'C1'
 }
 
-# Generate the plot
-fig, axes = plt.subplots(1, len(all_features_df['CEFR_Level'].unique()), figsize=(20, 10))
-fig.suptitle('Top 10 Standardized Random Forest Results for Lexical Complexity Indices per CEFR Level', fontsize=16)
-
-# Loop through each CEFR level and plot the standardized importance of the top 10 features
-for i, cefr_level in enumerate(sorted(all_features_df['CEFR_Level'].unique())):
-    cefr_data = all_features_df[all_features_df['CEFR_Level'] == cefr_level]
-    cefr_data = cefr_data.nlargest(10, 'Importance').sort_values(by='Importance', ascending=False)
-    
-    sns.barplot(
-        x='Importance', 
-        y='Feature', 
-        data=cefr_data, 
-        ax=axes[i],
-        palette="blend:#7AB,#EDA")
-    
-    axes[i].set_title(f'CEFR Level {cefr_mapping[cefr_level]}')  # Use the mapping to set the title
-    axes[i].grid(True, linestyle='--', linewidth=0.6, alpha=0.7)
-    axes[i].set_xlabel('')
-    axes[i].set_yticklabels(cefr_data['Feature'])  # Set y-tick labels for each subplot
-
-# Show the plot
-plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-plt.show()
-
-#Reimport LASSO Results for Random Forest for L1
-# Load your DataFrame with raw scores
-raw_scores_df = df
-#filter_df
-selected_features = combined_std_lasso_results['Unnamed: 0'].unique()
-existing_features = [feature for feature in selected_features if feature in df.columns]
-filtered_df = df[['cefr_numeric', 'l1','cefr'] + existing_features]
+# Summary table for the plot: the top 10 features of each CEFR level
+top_features_per_level = (all_features_df.sort_values(['CEFR_Level', 'Importance'], ascending=[True, False])
+                          .groupby('CEFR_Level').head(10).reset_index(drop=True))
 
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder, MinMaxScaler
-from sklearn.impute import SimpleImputer
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-import numpy as np
+# Generate the plot
+def plot_cefr_importances(top_features_per_level):
+    cefr_levels_sorted = sorted(top_features_per_level['CEFR_Level'].unique())
+    fig, axes = plt.subplots(1, len(cefr_levels_sorted), figsize=(20, 10))
+    fig.suptitle('Top 10 Standardized Random Forest Results for Lexical Complexity Indices per CEFR Level', fontsize=16)
+
+    # Loop through each CEFR level and plot the standardized importance of the top 10 features
+    for i, cefr_level in enumerate(cefr_levels_sorted):
+        cefr_data = top_features_per_level[top_features_per_level['CEFR_Level'] == cefr_level]
+        
+        sns.barplot(
+            x='Importance', 
+            y='Feature', 
+            data=cefr_data, 
+            ax=axes[i],
+            palette="blend:#7AB,#EDA")
+        
+        axes[i].set_title(f'CEFR Level {cefr_mapping[cefr_level]}')  # Use the mapping to set the title
+        axes[i].grid(True, linestyle='--', linewidth=0.6, alpha=0.7)
+        axes[i].set_xlabel('')
+        axes[i].set_yticklabels(cefr_data['Feature'])  # Set y-tick labels for each subplot
+
+    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+#Random Forest for L1: feature importances of the per-L1 models trained above
+from sklearn.preprocessing import MinMaxScaler
 
-# Initialize a dictionary to store feature importances for each first language
+# Dictionary of feature importances for each first language (the remaining rows of the importance array)
 feature_importances_per_l1 = {}
-
-# Initialize the imputer
-imputer = SimpleImputer(strategy='mean')
-
-# Loop through each first language to fit a Random Forest model
-for l1 in filtered_df['l1'].unique():
-    l1_data = filtered_df[filtered_df['l1'] == l1]
-    
-    # Impute missing values
-    l1_data_imputed = pd.DataFrame(imputer.fit_transform(l1_data.drop(['l1', 'cefr', 'cefr_numeric'], axis=1)), columns=l1_data.drop(['l1', 'cefr', 'cefr_numeric'], axis=1).columns)
-    
-    X = l1_data_imputed
-    y = l1_data['cefr_numeric'].reset_index(drop=True)
-    
-    if len(X) < 10:
-        continue
-    
-    rf = RandomForestClassifier(n_estimators=100, random_state=42)
-    rf.fit(X, y)
-    
-    feature_importances = pd.DataFrame({
-        'Feature': X.columns,
-        'Importance': rf.feature_importances_
+for l1, l1_importances in zip(l1_groups, importances[1 + len(cefr_levels):]):
+    feature_importances_per_l1[l1] = pd.DataFrame({
+        'Feature': l1_features,
+        'Importance': l1_importances
     }).sort_values(by='Importance', ascending=False)
-    
-    feature_importances_per_l1[l1] = feature_importances
 
 # Normalize the feature importances
 scaler = MinMaxScaler()
@@ -194,12 +164,19 @@ for l1, df in feature_importances_per_l1.items():
 
 # Consolidated plot
 consolidated_df = pd.concat([df.assign(L1=l1) for l1, df in feature_importances_per_l1.items()])
-plt.figure(figsize=(15, 15))
-sns.barplot(data=consolidated_df, x='NormalizedImportance', y='Feature', hue='L1', palette='blend:#7AB,#EDA')
-plt.title('Standardized Random Forest Results for Lexical Complexity Indices Across First Languages')
-plt.tight_layout()
-plt.savefig('random_forest_l1_analysis.png', dpi=300, bbox_inches='tight')
-plt.show()
+
+def plot_l1_importances(consolidated_df):
+    plt.figure(figsize=(15, 15))
+    sns.barplot(data=consolidated_df, x='NormalizedImportance', y='Feature', hue='L1', palette='blend:#7AB,#EDA')
+    plt.title('Standardized Random Forest Results for Lexical Complexity Indices Across First Languages')
+    plt.tight_layout()
+
+# Render all figures headless and in parallel; unchanged figures are skipped and FIGURES=none skips them all
+render_figures([
+    FigureJob('random_forest_top_features.png', plot_top_features, top_10_features),
+    FigureJob('random_forest_cefr_analysis.png', plot_cefr_importances, top_features_per_level),
+    FigureJob('random_forest_l1_analysis.png', plot_l1_importances, consolidated_df),
+])
 
 # Save results
 consolidated_df.to_csv('random_forest_l1_results.csv', index=False)
@@ -0,0 +1,189 @@
+"""
+Lexical Feature Store
+=====================
+
+Columnar store for the lexical feature matrix shared by the four lexical-complexity
+scripts, replacing the round trip through ``extracted_lexical_features.csv``.
+
+The store is a directory of Parquet part files plus a manifest::
+
+    <store>/manifest.json      feature and metadata columns, category lists, parts
+    <store>/part_00000.parquet one file per appended batch of essays
+
+- Each stage reads only the columns it needs; Parquet is column-oriented, so the
+  other ~80 feature columns are never read from disk. Files are memory-mapped, and
+  the float columns are passed to pandas without a separate copy per column.
+- The categorical columns (``l1``, ``cefr``) are encoded once, when rows are appended:
+  they are stored as integer codes into category lists kept in the manifest, and
+  ``read`` and ``dummies`` rebuild categoricals and dummy columns from the codes.
+- New essays are added with ``append`` as a new part file; existing parts are never
+  rewritten. New categories are added to the end of the category lists, so codes
+  already on disk stay valid.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_STORE = 'lexical_feature_store'
+CATEGORICAL_COLUMNS = ('l1', 'cefr')
+
+
+class FeatureStore:
+    """Append-only Parquet store of feature rows with a column manifest."""
+
+    def __init__(self, path=DEFAULT_STORE):
+        """
+        Args:
+            path: Store directory
+        """
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    @property
+    def n_rows(self):
+        return self.manifest['n_rows'] if self.manifest else 0
+
+    @property
+    def features(self):
+        return self.manifest['features'] if self.manifest else []
+
+    @property
+    def metadata_columns(self):
+        return self.manifest['metadata'] if self.manifest else []
+
+    @property
+    def categories(self):
+        return self.manifest['categories'] if self.manifest else {}
+
+    @property
+    def source_hash(self):
+        return self.manifest.get('source_hash') if self.manifest else None
+
+    def create(self, features, categorical_columns=CATEGORICAL_COLUMNS):
+        """
+        Start a new, empty store, removing any previous one.
+
+        Args:
+            features: Names of the float feature columns
+            categorical_columns: Metadata columns stored as category codes
+        """
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name.endswith('.parquet'):
+                os.remove(os.path.join(self.path, name))
+        self.manifest = {'features': list(features), 'metadata': [],
+                         'categories': {column: [] for column in categorical_columns},
+                         'parts': [], 'n_rows': 0}
+        self._save_manifest()
+
+    def append(self, metadata, features, source_hash=None):
+        """
+        Add rows as a new part file.
+
+        Args:
+            metadata: DataFrame with the metadata columns (e.g. l1, cefr, cefr_numeric, learner_id)
+            features: Array of shape (len(metadata), n_features), in the order of self.features
+            source_hash: Optional hash of all input texts and metadata stored so far, so that the next run
+                can check that the stored rows are still a prefix of its input
+        """
+        if self.manifest is None:
+            raise ValueError(f"No feature store at {self.path}; call create() first")
+        features = np.asarray(features, dtype=np.float64)
+        if features.shape != (len(metadata), len(self.features)):
+            raise ValueError(f"Expected a feature matrix of shape {(len(metadata), len(self.features))}, got {features.shape}")
+        if not len(metadata):
+            return
+        if self.manifest['metadata'] and list(metadata.columns) != self.manifest['metadata']:
+            raise ValueError(f"Metadata columns {list(metadata.columns)} do not match the store ({self.manifest['metadata']})")
+
+        columns = {}
+        for column in metadata.columns:
+            values = metadata[column]
+            if column in self.categories:
+                # Encode against the store-wide category list, extending it with new values
+                known = self.categories[column]
+                lookup = {value: code for code, value in enumerate(known)}
+                for value in pd.unique(values.dropna().astype(str)):
+                    if value not in lookup:
+                        lookup[value] = len(known)
+                        known.append(value)
+                codes = values.astype(str).map(lookup).where(values.notna(), -1).to_numpy(dtype=np.int32)
+                columns[column] = pa.array(codes, type=pa.int32())
+            elif pd.api.types.is_numeric_dtype(values):
+                columns[column] = pa.array(values.to_numpy(), from_pandas=True)
+            else:
+                columns[column] = pa.array(values.astype('string'), type=pa.string(), from_pandas=True)
+        for i, feature in enumerate(self.features):
+            columns[feature] = pa.array(features[:, i])
+
+        part = f"part_{len(self.manifest['parts']):05d}.parquet"
+        tmp_path = os.path.join(self.path, part + '.tmp')
+        pq.write_table(pa.table(columns), tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, part))
+
+        # The manifest is written last, so a part is only visible once it is complete
+        self.manifest['metadata'] = list(metadata.columns)
+        self.manifest['parts'].append({'file': part, 'n_rows': len(metadata)})
+        self.manifest['n_rows'] += len(metadata)
+        self.manifest['source_hash'] = source_hash
+        self._save_manifest()
+
+    def read(self, columns=None, categorical=True):
+        """
+        Read selected columns of all rows.
+
+        Args:
+            columns: Columns to read (defaults to all metadata and feature columns)
+            categorical: Return the categorical columns as pandas categoricals (else as integer codes)
+
+        Returns:
+            DataFrame
+        """
+        if self.manifest is None:
+            raise FileNotFoundError(f"No feature store at {self.path}; run 01_feature_extraction.py first")
+        if columns is None:
+            columns = self.manifest['metadata'] + self.features
+        columns = list(columns)
+        if not self.manifest['parts']:
+            return pd.DataFrame(columns=columns)
+
+        tables = [pq.read_table(os.path.join(self.path, part['file']), columns=columns, memory_map=True)
+                  for part in self.manifest['parts']]
+        df = pa.concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
+        if categorical:
+            for column in columns:
+                if column in self.categories:
+                    df[column] = pd.Categorical.from_codes(df[column].to_numpy(), self.categories[column])
+        return df
+
+    def dummies(self, df, columns=('l1',), drop_first=True):
+        """
+        Replace categorical columns by dummy columns, like pd.get_dummies(df, columns=..., drop_first=...).
+
+        Categories are ordered alphabetically, so the dummy columns do not depend on the
+        order in which the categories were appended.
+        """
+        df = df.copy()
+        for column in columns:
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = pd.Categorical.from_codes(df[column].to_numpy(), self.categories[column])
+            df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+        return pd.get_dummies(df, columns=list(columns), drop_first=drop_first)
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
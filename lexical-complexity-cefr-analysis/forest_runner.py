@@ -0,0 +1,94 @@
+"""
+Parallel Random Forest Training
+===============================
+
+Runs a batch of independent ``RandomForestClassifier`` fits (e.g. the one-vs-rest CEFR
+models and the per-L1 models of ``04_random_forest_analysis.py``) at the same time.
+
+The fits are spread over a process pool with one worker per fit (up to the number of
+cores), and the remaining cores are shared out as tree-building threads within each
+forest (``n_jobs``), so the machine is used fully without oversubscription. The whole
+batch then takes about as long as its slowest fit. Feature importances are collected
+into one preallocated array and the duration of every fit is reported.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+
+
+class ForestJob:
+    """One Random Forest fit."""
+
+    def __init__(self, name, X, y, n_estimators=100, impute=False, random_state=42):
+        """
+        Args:
+            name: Label of the fit (e.g. a CEFR level or an L1)
+            X: Feature matrix (array or DataFrame)
+            y: Target vector
+            n_estimators: Number of trees
+            impute: Mean-impute missing values of X before fitting
+            random_state: Random seed of the forest
+        """
+        self.name = name
+        self.X = np.asarray(X, dtype=np.float64)
+        self.y = np.asarray(y)
+        self.n_estimators = n_estimators
+        self.impute = impute
+        self.random_state = random_state
+
+
+def _fit(job, n_threads):
+    start = time.perf_counter()
+    X = SimpleImputer(strategy='mean').fit_transform(job.X) if job.impute else job.X
+    model = RandomForestClassifier(n_estimators=job.n_estimators, random_state=job.random_state, n_jobs=n_threads)
+    model.fit(X, job.y)
+    # Threads are only needed while fitting; predictions in the caller run single-threaded
+    model.set_params(n_jobs=None)
+    return model, time.perf_counter() - start
+
+
+def run_forest_jobs(jobs, n_workers=None, verbose=True):
+    """
+    Fit all jobs in parallel.
+
+    Args:
+        jobs: List of ForestJob with the same number of features
+        n_workers: Number of worker processes (defaults to min(len(jobs), number of cores))
+        verbose: Print the duration of every fit
+
+    Returns:
+        Tuple of (importances, models, timings): an array of shape (len(jobs), n_features)
+        with the feature importances of each job, a dict of name -> fitted model, and a
+        DataFrame with the number of samples and seconds per fit
+    """
+    n_cores = os.cpu_count() or 1
+    n_workers = n_workers or max(1, min(len(jobs), n_cores))
+    n_threads = max(1, n_cores // n_workers)
+
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_workers)(delayed(_fit)(job, n_threads) for job in jobs)
+    wall_time = time.perf_counter() - start
+
+    importances = np.empty((len(jobs), jobs[0].X.shape[1]), dtype=np.float64)
+    models = {}
+    for row, (job, (model, _)) in enumerate(zip(jobs, results)):
+        importances[row] = model.feature_importances_
+        models[job.name] = model
+
+    timings = pd.DataFrame({'Fit': [job.name for job in jobs],
+                            'Samples': [len(job.y) for job in jobs],
+                            'Seconds': [seconds for _, seconds in results]})
+    if verbose:
+        print(timings.to_string(index=False))
+        print(f"{len(jobs)} fits on {n_workers} workers x {n_threads} threads: "
+              f"{wall_time:.1f}s wall time, slowest fit {timings['Seconds'].max():.1f}s")
+    return importances, models, timings
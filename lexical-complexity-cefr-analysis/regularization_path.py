@@ -0,0 +1,176 @@
+"""
+LASSO Regularisation Path
+=========================
+
+Cross-validated selection of the L1 penalty for the multinomial LASSO models of
+``02_lasso_alpha_optimization.py`` and ``03_lasso_l1_analysis.py``.
+
+Compared with ``LogisticRegressionCV``:
+
+- each CV fold runs in its own process;
+- within a fold the C grid is walked from the strongest to the weakest penalty with
+  ``warm_start=True``, so every SAGA fit starts from the previous solution instead
+  of from zero;
+- the standardised training and test matrices of every fold are cached as ``.npy``
+  files (keyed by the data), so re-running the selection does not rescale anything;
+- the final model is refitted once on all data, starting from the mean fold solution
+  at the chosen C, and saved with ``joblib`` so the L1 analysis can load it instead of
+  refitting at a hard-coded alpha.
+
+Unlike ``LogisticRegressionCV`` inside the original pipeline, the scaler is fitted on
+the training part of each fold only.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import hashlib
+import os
+import warnings
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.compose import ColumnTransformer
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+DEFAULT_CS = np.logspace(-4, 4, 10)  # the LogisticRegressionCV default grid (Cs=10)
+MODEL_PATH = 'lasso_model.joblib'
+
+
+def lasso_classifier(C=1.0, warm_start=False):
+    """The multinomial L1 logistic regression used throughout the LASSO analysis."""
+    return LogisticRegression(C=C, penalty='l1', solver='saga', max_iter=5000, multi_class='multinomial',
+                              random_state=42, warm_start=warm_start)
+
+
+def data_fingerprint(X, y):
+    """Short hash of a feature matrix and target vector, identifying the data a model was fitted on."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.asarray(y).astype(str)
+    return hashlib.sha1(X.tobytes() + y.tobytes()).hexdigest()[:16]
+
+
+def scaled_folds(X, y, cv=5, cache_dir='lasso_folds'):
+    """
+    Split the data into stratified folds and cache the standardised matrices of each fold.
+
+    Args:
+        X: Feature matrix (DataFrame or array)
+        y: Target vector
+        cv: Number of folds
+        cache_dir: Directory for the cached fold matrices
+
+    Returns:
+        List of dicts with the paths of X_train, y_train, X_test and y_test of each fold
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.asarray(y).astype(str)
+    digest = data_fingerprint(X, y)
+    fold_dir = os.path.join(cache_dir, f'{digest}_cv{cv}')
+    os.makedirs(fold_dir, exist_ok=True)
+
+    folds = []
+    for fold, (train, test) in enumerate(StratifiedKFold(n_splits=cv).split(X, y)):
+        paths = {name: os.path.join(fold_dir, f'fold{fold}_{name}.npy')
+                 for name in ('X_train', 'y_train', 'X_test', 'y_test')}
+        if not all(os.path.exists(path) for path in paths.values()):
+            scaler = StandardScaler().fit(X[train])
+            np.save(paths['X_train'], scaler.transform(X[train]))
+            np.save(paths['X_test'], scaler.transform(X[test]))
+            np.save(paths['y_train'], y[train])
+            np.save(paths['y_test'], y[test])
+        folds.append(paths)
+    return folds
+
+
+def _fold_path(paths, Cs):
+    """Fit the whole C grid on one fold, warm-starting each fit from the previous one."""
+    X_train, X_test = np.load(paths['X_train'], mmap_mode='r'), np.load(paths['X_test'], mmap_mode='r')
+    y_train, y_test = np.load(paths['y_train']), np.load(paths['y_test'])
+
+    model = lasso_classifier(warm_start=True)
+    scores, coefs, intercepts = [], [], []
+    for C in Cs:
+        model.set_params(C=C)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            model.fit(X_train, y_train)
+        scores.append(model.score(X_test, y_test))
+        coefs.append(model.coef_.copy())
+        intercepts.append(model.intercept_.copy())
+    return np.array(scores), np.array(coefs), np.array(intercepts)
+
+
+def fit_regularization_path(X, y, Cs=DEFAULT_CS, cv=5, cache_dir='lasso_folds', n_jobs=None):
+    """
+    Choose C by cross-validated accuracy and refit the LASSO model on all data.
+
+    Args:
+        X: Feature DataFrame (all columns are standardised)
+        y: Target vector
+        Cs: Grid of inverse regularisation strengths
+        cv: Number of folds
+        cache_dir: Directory for the cached fold matrices
+        n_jobs: Number of folds fitted in parallel (defaults to cv)
+
+    Returns:
+        Dict with the fitted 'pipeline', the chosen 'C' and 'alpha', the 'Cs' grid, the
+        per-fold 'scores' (n_folds x n_Cs), the 'feature_names', the 'classes' and the
+        'data_hash' of X and y
+    """
+    Cs = np.sort(np.asarray(Cs, dtype=np.float64))  # strongest penalty first
+    folds = scaled_folds(X, y, cv, cache_dir)
+    results = Parallel(n_jobs=n_jobs or cv)(delayed(_fold_path)(paths, Cs) for paths in folds)
+    scores = np.array([fold_scores for fold_scores, _, _ in results])
+    best = int(np.argmax(scores.mean(axis=0)))
+
+    # Refit on all data, starting from the mean fold solution at the chosen C
+    classifier = lasso_classifier(C=Cs[best], warm_start=True)
+    classifier.coef_ = np.mean([coefs[best] for _, coefs, _ in results], axis=0)
+    classifier.intercept_ = np.mean([intercepts[best] for _, _, intercepts in results], axis=0)
+    pipeline = Pipeline([
+        ('preprocessor', ColumnTransformer(transformers=[('scale', StandardScaler(), X.columns)], remainder='passthrough')),
+        ('classifier', classifier)
+    ])
+    pipeline.fit(X, y)
+
+    return {
+        'pipeline': pipeline,
+        'C': Cs[best],
+        'alpha': 1 / Cs[best],
+        'Cs': Cs,
+        'scores': scores,
+        'feature_names': list(X.columns),
+        'classes': list(classifier.classes_),
+        'data_hash': data_fingerprint(X, y),
+    }
+
+
+def save_model(result, path=MODEL_PATH):
+    """Save the result of fit_regularization_path for the L1 analysis."""
+    joblib.dump(result, path)
+
+
+def load_model(X, y, path=MODEL_PATH):
+    """
+    Load a saved LASSO model if it was fitted on the same features and data.
+
+    Args:
+        X: Feature DataFrame the caller is about to use
+        y: Target vector the caller is about to use
+        path: File written by save_model
+
+    Returns:
+        The saved result dict, or None if there is no matching model
+    """
+    if not os.path.exists(path):
+        return None
+    result = joblib.load(path)
+    if result['feature_names'] != list(X.columns) or result.get('data_hash') != data_fingerprint(X, y):
+        return None
+    return result
@@ -0,0 +1,174 @@
+"""
+Noun Phrase Annotation Store
+============================
+
+Streaming writer for the noun modifier annotations of ``main.py``.
+
+Annotations are written to Parquet in row groups of ``chunk_size`` rows while the
+corpus is being parsed, instead of being collected in lists of dictionaries and
+converted to one DataFrame at the end. Every sentence is stored once, in a separate
+sentence table, and annotation rows refer to it by ``sentence_id``::
+
+    noun_phrase_annotations.parquet  doc_key, sentence_id, modifier_text, noun_text,
+                                     noun_modifier, modifier_position, type,
+                                     native_language, cefr
+    noun_phrase_sentences.parquet    doc_key, sentence_id, sentence
+
+The low-cardinality columns (modifier type, position, L1, CEFR level) are dictionary
+encoded, so the annotation table stays small enough to load whole for the statistics
+and plots; the sentence text is only read when it is needed, e.g. with
+``read_annotations(..., sentences_path=...)``.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import logging
+import os
+import sys
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.incremental import DOC_KEY
+from common.memory import memory_usage_mb
+
+logger = logging.getLogger(__name__)
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+ANNOTATION_SCHEMA = pa.schema([
+    (DOC_KEY, pa.string()),
+    ('sentence_id', pa.int64()),
+    ('modifier_text', pa.string()),
+    ('noun_text', pa.string()),
+    ('noun_modifier', _CATEGORY),
+    ('modifier_position', _CATEGORY),
+    ('type', _CATEGORY),
+    ('native_language', _CATEGORY),
+    ('cefr', _CATEGORY),
+])
+
+SENTENCE_SCHEMA = pa.schema([
+    (DOC_KEY, pa.string()),
+    ('sentence_id', pa.int64()),
+    ('sentence', pa.string()),
+])
+
+# Annotation fields copied from the extractor dictionaries ('sentence' is replaced by its id)
+ANNOTATION_FIELDS = [name for name in ANNOTATION_SCHEMA.names if name not in (DOC_KEY, 'sentence_id')]
+
+
+def _as_string(value):
+    """Return a value as a string, or None if it is missing or NaN."""
+    if value is None or value != value:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+class AnnotationWriter:
+    """Write annotation rows and their sentences to Parquet, one row group per chunk."""
+
+    def __init__(self, annotations_path, sentences_path, first_sentence_id=0, chunk_size=50000):
+        """
+        Args:
+            annotations_path: Parquet file for the annotation table
+            sentences_path: Parquet file for the sentence table
+            first_sentence_id: Id of the first new sentence (ids must stay unique across merged runs)
+            chunk_size: Number of annotation rows per row group
+        """
+        self.annotations_path = annotations_path
+        self.sentences_path = sentences_path
+        self.next_sentence_id = first_sentence_id
+        self.chunk_size = chunk_size
+        self.n_annotations = 0
+        self.n_sentences = 0
+        self._annotation_writer = None
+        self._sentence_writer = None
+        self._clear()
+
+    def __enter__(self):
+        self._annotation_writer = pq.ParquetWriter(self.annotations_path, ANNOTATION_SCHEMA)
+        self._sentence_writer = pq.ParquetWriter(self.sentences_path, SENTENCE_SCHEMA)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+        self._annotation_writer.close()
+        self._sentence_writer.close()
+
+    def _clear(self):
+        self._annotations = {name: [] for name in ANNOTATION_SCHEMA.names}
+        self._sentences = {name: [] for name in SENTENCE_SCHEMA.names}
+
+    def add(self, rows):
+        """
+        Add the annotation rows of one document.
+
+        Identical sentence texts within the document share one sentence id.
+
+        Args:
+            rows: List of annotation dictionaries as returned by the extractors
+        """
+        sentence_ids = {}
+        for row in rows:
+            doc_key = row.get(DOC_KEY)
+            sentence = row['sentence']
+            sentence_id = sentence_ids.get(sentence)
+            if sentence_id is None:
+                sentence_id = sentence_ids[sentence] = self.next_sentence_id
+                self.next_sentence_id += 1
+                self._sentences[DOC_KEY].append(doc_key)
+                self._sentences['sentence_id'].append(sentence_id)
+                self._sentences['sentence'].append(sentence)
+
+            self._annotations[DOC_KEY].append(doc_key)
+            self._annotations['sentence_id'].append(sentence_id)
+            for name in ANNOTATION_FIELDS:
+                self._annotations[name].append(_as_string(row.get(name)))
+
+        if len(self._annotations['sentence_id']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one row group of each table."""
+        n_rows = len(self._annotations['sentence_id'])
+        if n_rows:
+            self._annotation_writer.write_table(pa.table(self._annotations, schema=ANNOTATION_SCHEMA))
+            self._sentence_writer.write_table(pa.table(self._sentences, schema=SENTENCE_SCHEMA))
+            self.n_annotations += n_rows
+            self.n_sentences += len(self._sentences['sentence_id'])
+            logger.info(f"{self.n_annotations} annotations written, memory {memory_usage_mb():.0f} MB")
+        self._clear()
+
+
+def next_sentence_id(sentences_path):
+    """Return the first unused sentence id of an existing sentence table (0 if there is none)."""
+    if not os.path.exists(sentences_path):
+        return 0
+    ids = pq.read_table(sentences_path, columns=['sentence_id'])['sentence_id']
+    return int(pc.max(ids).as_py()) + 1 if len(ids) else 0
+
+
+def read_annotations(annotations_path, columns=None, sentences_path=None):
+    """
+    Load the annotation table.
+
+    Args:
+        annotations_path: Parquet file written by AnnotationWriter
+        columns: Columns to read (defaults to all)
+        sentences_path: Sentence table to join back in as a 'sentence' column (the wide layout
+            of the old noun_phrase_results.csv); omit it to keep the sentence text on disk
+
+    Returns:
+        DataFrame with categorical modifier, position, type, L1 and CEFR columns
+    """
+    if columns is not None and sentences_path is not None and 'sentence_id' not in columns:
+        columns = list(columns) + ['sentence_id']
+    df = pq.read_table(annotations_path, columns=columns, memory_map=True).to_pandas()
+    if sentences_path is not None:
+        sentences = pq.read_table(sentences_path, columns=['sentence_id', 'sentence']).to_pandas()
+        df = df.merge(sentences, on='sentence_id', how='left')
+    return df
@@ -0,0 +1,150 @@
+"""
+Noun Modifier Count Cube
+========================
+
+Pre-aggregated counts of the noun modifier annotations, for the statistics and
+plots of ``main.py``.
+
+The annotation table is reduced once to a count per combination of
+
+    noun_modifier x modifier_position x type x cefr x native_language
+
+and the result is saved next to it (``noun_phrase_counts.parquet``, with categorical,
+integer-coded dimensions). The cube has at most a few thousand rows however large
+the corpus is, so the Z-scores, relative frequencies and summary statistics are
+vectorised operations on the cube and never touch the raw annotations. The cube
+is rebuilt only when the annotation table changes (by size and modification time).
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ['noun_modifier', 'modifier_position', 'type', 'cefr', 'native_language']
+MODIFIER_COLUMNS = ['noun_modifier', 'modifier_position', 'type']
+_SOURCE_KEY = b'count_cube_source'
+_CUBE_VERSION = 2  # bump when the counting changes so that saved cubes are rebuilt
+MISSING_LEVEL = 'unknown'
+
+
+def _source_signature(annotations_path):
+    stat = os.stat(annotations_path)
+    return json.dumps({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'version': _CUBE_VERSION})
+
+
+class CountCube:
+    """Annotation counts per modifier, position, type, CEFR level and L1."""
+
+    def __init__(self, counts):
+        """
+        Args:
+            counts: DataFrame with the DIMENSIONS as categorical columns and a 'count' column
+        """
+        self.counts = counts
+
+    @classmethod
+    def build(cls, annotations_path, cube_path=None):
+        """
+        Count the annotations, or load the saved cube if the annotation table is unchanged.
+
+        Args:
+            annotations_path: Parquet annotation table written by annotation_store.AnnotationWriter
+            cube_path: File for the saved cube (defaults to noun_phrase_counts.parquet next to the table)
+
+        Returns:
+            CountCube
+        """
+        if cube_path is None:
+            cube_path = os.path.join(os.path.dirname(annotations_path), 'noun_phrase_counts.parquet')
+        signature = _source_signature(annotations_path)
+
+        if os.path.exists(cube_path):
+            saved = pq.read_table(cube_path)
+            if (saved.schema.metadata or {}).get(_SOURCE_KEY) == signature.encode('utf-8'):
+                return cls(saved.to_pandas())
+
+        # Read only the dimension columns; they are dictionary encoded, so grouping works on codes
+        annotations = pq.read_table(annotations_path, columns=DIMENSIONS, memory_map=True).to_pandas()
+        # Count annotations with a missing CEFR level or L1 under 'unknown' instead of dropping them
+        for column in DIMENSIONS:
+            values = annotations[column]
+            if values.isna().any():
+                if MISSING_LEVEL not in values.cat.categories:
+                    values = values.cat.add_categories(MISSING_LEVEL)
+                annotations[column] = values.fillna(MISSING_LEVEL)
+        counts = annotations.groupby(DIMENSIONS, observed=True, dropna=False).size().reset_index(name='count')
+        logger.info(f"Counted {len(annotations)} annotations into {len(counts)} cells")
+
+        table = pa.Table.from_pandas(counts, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _SOURCE_KEY: signature})
+        tmp_path = cube_path + '.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cube_path)
+        return cls(counts)
+
+    @property
+    def total(self):
+        return int(self.counts['count'].sum())
+
+    def levels(self, dimension):
+        """Sorted values of a dimension that occur in the annotations."""
+        return sorted(self.counts.loc[self.counts['count'] > 0, dimension].unique())
+
+    def marginal(self, by):
+        """
+        Sum the cube over all dimensions except the given ones.
+
+        Args:
+            by: Dimension name or list of dimension names
+
+        Returns:
+            Series of counts indexed by the given dimensions
+        """
+        return self.counts.groupby(by, observed=True, dropna=False)['count'].sum()
+
+    def zscores(self, by):
+        """
+        Z-score the modifier counts within each level of a dimension.
+
+        Equivalent to applying scipy.stats.zscore (ddof=0) to every column of the
+        modifier x level count table.
+
+        Args:
+            by: Dimension whose levels become columns (e.g. 'cefr' or 'native_language')
+
+        Returns:
+            DataFrame with the modifier columns, one count column per level and one
+            '<level>_z' column per level
+        """
+        table = self.marginal(MODIFIER_COLUMNS + [by]).unstack(fill_value=0)
+        values = table.to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (values - values.mean(axis=0)) / values.std(axis=0)
+        levels = [str(level) for level in table.columns]
+        z_scores = pd.DataFrame(z, index=table.index, columns=[level + '_z' for level in levels])
+        table.columns = levels
+        return pd.concat([table, z_scores], axis=1).reset_index()
+
+    def relative_frequencies(self, by='cefr'):
+        """
+        Share of each modifier type among all annotations of each level of a dimension.
+
+        Args:
+            by: Dimension to normalise within (e.g. 'cefr')
+
+        Returns:
+            DataFrame with 'noun_modifier', by, 'Count' and 'Relative_Frequency' columns
+        """
+        count_data = self.marginal(['noun_modifier', by]).reset_index(name='Count')
+        count_data['Relative_Frequency'] = count_data['Count'] / count_data.groupby(by, observed=True)['Count'].transform('sum')
+        return count_data
@@ -11,212 +11,266 @@ Author: Fatih Ünal Bozdağ
 Email: fbozdag1989@gmail.com
 """
 
-import spacy
-import torch
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import logging
-import re
-from scipy.stats import zscore
+import argparse
 import os
+import sys
+
+# spaCy and the transformer model, pyarrow and the plotting libraries are imported by the
+# stages that use them, so that --help and small jobs start quickly
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus import iter_corpus
+from common.incremental import DOC_KEY, IncrementalManifest
+from common.parse_cache import ParseCache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Configure pandas and plotting
+# Configure pandas
 pd.set_option('display.max_colwidth', None)
-plt.show(block=True)
-plt.interactive(False)
-sns.set_theme(style="darkgrid")
 
-# Load the English NLP model
-nlp = spacy.load("en_core_web_trf")
-torch.device("mps")
-spacy.require_gpu()
+# Parsed documents are cached on disk and reused across runs and scripts
+parse_cache = ParseCache()
 
-def annotate_attributive_adjective(corpus_with_context):
+_nlp = None
+execution = None
+
+def load_model():
+    """
+    Select GPU or multi-process CPU parsing and load the English NLP model, once.
+    
+    Returns:
+        Tuple of (nlp, execution settings)
+    """
+    global _nlp, execution
+    if _nlp is None:
+        import spacy
+        from common.execution import setup_execution
+        from common.memory import add_activation_cleaner
+        execution = setup_execution()
+        _nlp = spacy.load("en_core_web_trf")
+        add_activation_cleaner(_nlp)  # Drop transformer activations once the parser and tagger have used them
+    return _nlp, execution
+
+# Bump when an extractor changes its output so that incremental runs rebuild all results
+EXTRACTOR_VERSION = 1
+
+def extract_attributive_adjective(doc, context):
     """
-    Annotate attributive adjectives modifying nouns.
+    Extract attributive adjectives modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
+    
+    Returns:
+        List of dictionaries with annotation information
+    """
+    annotations = []
+    for chunk in doc.noun_chunks:
+        adjectives = []
+        # Explore each token in the noun chunk
+        for token in chunk:
+            if token.dep_ == 'amod' and token.pos_ == 'ADJ':
+                # Include adjectives and any conjunction-connected adjectives
+                if token not in adjectives:
+                    adjectives.append(token)
+                    adjectives.extend(child for child in token.conjuncts 
+                                    if child.pos_ == 'ADJ' and child not in adjectives)
+
+        if adjectives:
+            # Sort adjectives by their index in the document
+            sorted_adjectives = sorted(adjectives, key=lambda adj: adj.i)
+            # Join all adjectives for a single noun into one string
+            modifier_text = ' and '.join(adj.text for adj in sorted_adjectives)
+            annotations.append({
+                "modifier_text": modifier_text,
+                "noun_text": chunk.root.text,
+                "noun_modifier": "Attributive Adjective",
+                "modifier_position": "pre",
+                "type": "phrasal",
+                "sentence": chunk.sent.text,
+                "native_language": context.get('l1', 'unknown'),
+                "cefr": context.get('cefr', 'unknown')
+            })
+    return annotations
+
+def extract_premodifying_nouns(doc, context):
+    """
+    Extract premodifying nouns (compound nouns) from a parsed document.
+    
+    Args:
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for chunk in doc.noun_chunks:
-            adjectives = []
-            # Explore each token in the noun chunk
-            for token in chunk:
-                if token.dep_ == 'amod' and token.pos_ == 'ADJ':
-                    # Include adjectives and any conjunction-connected adjectives
-                    if token not in adjectives:
-                        adjectives.append(token)
-                        adjectives.extend(child for child in token.conjuncts 
-                                        if child.pos_ == 'ADJ' and child not in adjectives)
-
-            if adjectives:
-                # Sort adjectives by their index in the document
-                sorted_adjectives = sorted(adjectives, key=lambda adj: adj.i)
-                # Join all adjectives for a single noun into one string
-                modifier_text = ' and '.join(adj.text for adj in sorted_adjectives)
+    for chunk in doc.noun_chunks:
+        # Inspect each token within the noun chunk
+        for token in chunk:
+            # Check if the token is a noun modifying another noun (compound) within a noun chunk
+            if token.dep_ == 'compound' and token.head.pos_ == 'NOUN' and token.head in chunk:
                 annotations.append({
-                    "modifier_text": modifier_text,
-                    "noun_text": chunk.root.text,
-                    "noun_modifier": "Attributive Adjective",
+                    "modifier_text": token.text,
+                    "noun_text": token.head.text,
+                    "noun_modifier": "Premodifying Noun",
                     "modifier_position": "pre",
                     "type": "phrasal",
-                    "sentence": chunk.sent.text,
+                    "sentence": token.sent.text,
                     "native_language": context.get('l1', 'unknown'),
                     "cefr": context.get('cefr', 'unknown')
                 })
     return annotations
 
-def annotate_premodifying_nouns(corpus_with_context):
+def extract_relative_clauses(doc, context):
     """
-    Annotate premodifying nouns (compound nouns).
+    Extract relative clauses modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for chunk in doc.noun_chunks:
-            # Inspect each token within the noun chunk
-            for token in chunk:
-                # Check if the token is a noun modifying another noun (compound) within a noun chunk
-                if token.dep_ == 'compound' and token.head.pos_ == 'NOUN' and token.head in chunk:
-                    annotations.append({
-                        "modifier_text": token.text,
-                        "noun_text": token.head.text,
-                        "noun_modifier": "Premodifying Noun",
-                        "modifier_position": "pre",
-                        "type": "phrasal",
-                        "sentence": token.sent.text,
-                        "native_language": context.get('l1', 'unknown'),
-                        "cefr": context.get('cefr', 'unknown')
-                    })
+    for token in doc:
+        # Check if the token is a verb that is the root of a relative clause
+        if token.dep_ == 'relcl' and token.head.pos_ == 'NOUN':
+            # Build the relative clause text
+            clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
+            annotations.append({
+                "modifier_text": clause_text,
+                "noun_text": token.head.text,
+                "noun_modifier": "Relative Clause",
+                "modifier_position": "post",
+                "type": "clausal",
+                "sentence": token.sent.text,
+                "native_language": context.get('l1', 'unknown'),
+                "cefr": context.get('cefr', 'unknown')
+            })
     return annotations
 
-def annotate_relative_clauses(corpus_with_context):
+def extract_ing_clauses(doc, context):
     """
-    Annotate relative clauses modifying nouns.
+    Extract -ing clauses modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for token in doc:
-            # Check if the token is a verb that is the root of a relative clause
-            if token.dep_ == 'relcl' and token.head.pos_ == 'NOUN':
-                # Build the relative clause text
-                clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
-                annotations.append({
-                    "modifier_text": clause_text,
-                    "noun_text": token.head.text,
-                    "noun_modifier": "Relative Clause",
-                    "modifier_position": "post",
-                    "type": "clausal",
-                    "sentence": token.sent.text,
-                    "native_language": context.get('l1', 'unknown'),
-                    "cefr": context.get('cefr', 'unknown')
-                })
+    for token in doc:
+        # Check for gerund verbs acting as adjectival clauses
+        if token.pos_ == 'VERB' and token.dep_ == 'acl' and token.tag_ == 'VBG':
+            # Build the -ing clause text
+            clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
+            annotations.append({
+                "modifier_text": clause_text,
+                "noun_text": token.head.text,
+                "noun_modifier": "-ing Clause",
+                "modifier_position": "post",
+                "type": "clausal",
+                "sentence": token.sent.text,
+                "native_language": context.get('l1', 'unknown'),
+                "cefr": context.get('cefr', 'unknown')
+            })
     return annotations
 
-def annotate_ing_clauses(corpus_with_context):
+def extract_ed_clauses(doc, context):
     """
-    Annotate -ing clauses modifying nouns.
+    Extract -ed clauses modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for token in doc:
-            # Check for gerund verbs acting as adjectival clauses
-            if token.pos_ == 'VERB' and token.dep_ == 'acl' and token.tag_ == 'VBG':
-                # Build the -ing clause text
-                clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
-                annotations.append({
-                    "modifier_text": clause_text,
-                    "noun_text": token.head.text,
-                    "noun_modifier": "-ing Clause",
-                    "modifier_position": "post",
-                    "type": "clausal",
-                    "sentence": token.sent.text,
-                    "native_language": context.get('l1', 'unknown'),
-                    "cefr": context.get('cefr', 'unknown')
-                })
+    for token in doc:
+        # Check for past participle verbs acting as adjectival clauses
+        if token.pos_ == 'VERB' and token.dep_ == 'acl' and token.tag_ == 'VBN':
+            # Build the -ed clause text
+            clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
+            annotations.append({
+                "modifier_text": clause_text,
+                "noun_text": token.head.text,
+                "noun_modifier": "-ed Clause",
+                "modifier_position": "post",
+                "type": "clausal",
+                "sentence": token.sent.text,
+                "native_language": context.get('l1', 'unknown'),
+                "cefr": context.get('cefr', 'unknown')
+            })
     return annotations
 
-def annotate_ed_clauses(corpus_with_context):
+def extract_prepositional_phrases_of(doc, context):
     """
-    Annotate -ed clauses modifying nouns.
+    Extract prepositional phrases with 'of' modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for token in doc:
-            # Check for past participle verbs acting as adjectival clauses
-            if token.pos_ == 'VERB' and token.dep_ == 'acl' and token.tag_ == 'VBN':
-                # Build the -ed clause text
-                clause_text = ' '.join([tok.text_with_ws for tok in token.subtree]).strip()
+    for token in doc:
+        # Check for the preposition 'of' linking to a noun
+        if token.text.lower() == 'of' and token.dep_ == 'prep':
+            # The head of the preposition should be a noun and the object should also be a noun
+            if token.head.pos_ == 'NOUN' and any(child.pos_ == 'NOUN' for child in token.children):
+                # Build the prepositional phrase text
+                phrase_text = 'of ' + ' '.join(child.text_with_ws for child in token.children 
+                                             if child.dep_ != 'punct').strip()
                 annotations.append({
-                    "modifier_text": clause_text,
+                    "modifier_text": phrase_text,
                     "noun_text": token.head.text,
-                    "noun_modifier": "-ed Clause",
+                    "noun_modifier": "Prepositional Phrase (of)",
                     "modifier_position": "post",
-                    "type": "clausal",
+                    "type": "phrasal",
                     "sentence": token.sent.text,
                     "native_language": context.get('l1', 'unknown'),
                     "cefr": context.get('cefr', 'unknown')
                 })
     return annotations
 
-def annotate_prepositional_phrases_of(corpus_with_context):
+def extract_prepositional_phrases_other(doc, context):
     """
-    Annotate prepositional phrases with 'of' modifying nouns.
+    Extract other prepositional phrases modifying nouns from a parsed document.
     
     Args:
-        corpus_with_context: List of tuples containing (text, context_dict)
+        doc: spaCy Doc
+        context: Context dictionary of the document
     
     Returns:
         List of dictionaries with annotation information
     """
     annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for token in doc:
-            # Check for the preposition 'of' linking to a noun
-            if token.text.lower() == 'of' and token.dep_ == 'prep':
-                # The head of the preposition should be a noun and the object should also be a noun
-                if token.head.pos_ == 'NOUN' and any(child.pos_ == 'NOUN' for child in token.children):
-                    # Build the prepositional phrase text
-                    phrase_text = 'of ' + ' '.join(child.text_with_ws for child in token.children 
-                                                 if child.dep_ != 'punct').strip()
+    for token in doc:
+        # Check if the token is a preposition and not 'of'
+        if token.dep_ == 'prep' and token.lemma_ != 'of':
+            # Look for noun objects of the preposition
+            pobj = next((child for child in token.children 
+                       if child.dep_ == 'pobj' and child.pos_ == 'NOUN'), None)
+            if pobj:
+                # Ensure the preposition directly follows a noun (check token's head is a noun)
+                if token.head.pos_ == 'NOUN':
+                    phrase_text = token.text + ' ' + pobj.text
                     annotations.append({
                         "modifier_text": phrase_text,
                         "noun_text": token.head.text,
-                        "noun_modifier": "Prepositional Phrase (of)",
+                        "noun_modifier": "Prepositional Phrase (other)",
                         "modifier_position": "post",
                         "type": "phrasal",
                         "sentence": token.sent.text,
@@ -225,79 +279,126 @@ def annotate_prepositional_phrases_of(corpus_with_context):
                     })
     return annotations
 
-def annotate_prepositional_phrases_other(corpus_with_context):
+# Registered noun modifier extractors, applied in this order to every parsed document.
+# Each extractor takes (doc, context) and returns a list of annotation dictionaries.
+MODIFIER_EXTRACTORS = {
+    "Attributive Adjective": extract_attributive_adjective,
+    "Premodifying Noun": extract_premodifying_nouns,
+    "Relative Clause": extract_relative_clauses,
+    "-ing Clause": extract_ing_clauses,
+    "-ed Clause": extract_ed_clauses,
+    "Prepositional Phrase (of)": extract_prepositional_phrases_of,
+    "Prepositional Phrase (other)": extract_prepositional_phrases_other,
+}
+
+def register_extractor(name, extractor):
+    """
+    Register an additional noun modifier extractor.
+    
+    Registered extractors share the single parse performed by iter_annotations,
+    so a new modifier type does not add another pass over the corpus. Only the
+    standard annotation fields (see annotation_store.ANNOTATION_SCHEMA) are saved.
+    
+    Args:
+        name: Name of the noun modifier type
+        extractor: Function taking (doc, context) and returning a list of annotations
+    """
+    MODIFIER_EXTRACTORS[name] = extractor
+
+def iter_annotations(corpus_with_context, extractors=None):
     """
-    Annotate other prepositional phrases modifying nouns.
+    Parse each document once and apply all extractors to the same Doc.
+    
+    Args:
+        corpus_with_context: Iterable of tuples containing (text, context_dict)
+        extractors: Dictionary of name -> extractor function (defaults to MODIFIER_EXTRACTORS)
+    
+    Yields:
+        Dictionary of name -> list of annotation dictionaries, one per document
+    """
+    if extractors is None:
+        extractors = MODIFIER_EXTRACTORS
+    
+    nlp, execution = load_model()
+    for doc, context in parse_cache.pipe(nlp, corpus_with_context, as_tuples=True, **execution.pipe_kwargs()):
+        annotations = {}
+        for name, extractor in extractors.items():
+            rows = extractor(doc, context)
+            # Tag rows with the document key assigned by an incremental run
+            if DOC_KEY in context:
+                for row in rows:
+                    row[DOC_KEY] = context[DOC_KEY]
+            annotations[name] = rows
+        yield annotations
+
+def run_extractors(corpus_with_context, extractors=None):
+    """
+    Apply all extractors to a single parse of the corpus and collect their rows.
     
     Args:
         corpus_with_context: List of tuples containing (text, context_dict)
+        extractors: Dictionary of name -> extractor function (defaults to MODIFIER_EXTRACTORS)
     
     Returns:
-        List of dictionaries with annotation information
+        Dictionary of name -> list of dictionaries with annotation information
     """
-    annotations = []
-    for doc, context in nlp.pipe(corpus_with_context, as_tuples=True):
-        for token in doc:
-            # Check if the token is a preposition and not 'of'
-            if token.dep_ == 'prep' and token.lemma_ != 'of':
-                # Look for noun objects of the preposition
-                pobj = next((child for child in token.children 
-                           if child.dep_ == 'pobj' and child.pos_ == 'NOUN'), None)
-                if pobj:
-                    # Ensure the preposition directly follows a noun (check token's head is a noun)
-                    if token.head.pos_ == 'NOUN':
-                        phrase_text = token.text + ' ' + pobj.text
-                        annotations.append({
-                            "modifier_text": phrase_text,
-                            "noun_text": token.head.text,
-                            "noun_modifier": "Prepositional Phrase (other)",
-                            "modifier_position": "post",
-                            "type": "phrasal",
-                            "sentence": token.sent.text,
-                            "native_language": context.get('l1', 'unknown'),
-                            "cefr": context.get('cefr', 'unknown')
-                        })
+    if extractors is None:
+        extractors = MODIFIER_EXTRACTORS
+    
+    annotations = {name: [] for name in extractors}
+    for doc_annotations in iter_annotations(corpus_with_context, extractors):
+        for name, rows in doc_annotations.items():
+            annotations[name].extend(rows)
     return annotations
 
+def _annotate(corpus_with_context, name):
+    """Run a single registered extractor over the corpus."""
+    return run_extractors(corpus_with_context, {name: MODIFIER_EXTRACTORS[name]})[name]
+
+def annotate_attributive_adjective(corpus_with_context):
+    """Annotate attributive adjectives modifying nouns."""
+    return _annotate(corpus_with_context, "Attributive Adjective")
+
+def annotate_premodifying_nouns(corpus_with_context):
+    """Annotate premodifying nouns (compound nouns)."""
+    return _annotate(corpus_with_context, "Premodifying Noun")
+
+def annotate_relative_clauses(corpus_with_context):
+    """Annotate relative clauses modifying nouns."""
+    return _annotate(corpus_with_context, "Relative Clause")
+
+def annotate_ing_clauses(corpus_with_context):
+    """Annotate -ing clauses modifying nouns."""
+    return _annotate(corpus_with_context, "-ing Clause")
+
+def annotate_ed_clauses(corpus_with_context):
+    """Annotate -ed clauses modifying nouns."""
+    return _annotate(corpus_with_context, "-ed Clause")
+
+def annotate_prepositional_phrases_of(corpus_with_context):
+    """Annotate prepositional phrases with 'of' modifying nouns."""
+    return _annotate(corpus_with_context, "Prepositional Phrase (of)")
+
+def annotate_prepositional_phrases_other(corpus_with_context):
+    """Annotate other prepositional phrases modifying nouns."""
+    return _annotate(corpus_with_context, "Prepositional Phrase (other)")
+
 def load_corpus_data(file_path):
     """
     Load and prepare corpus data for analysis.
     
     Args:
-        file_path: Path to the CSV file containing the corpus data
+        file_path: Path to the CSV or Parquet file containing the corpus data
     
     Returns:
-        List of tuples containing (text, context_dict)
+        Iterator of tuples containing (text, context_dict)
     """
     logger.info(f"Loading corpus data from {file_path}")
     
-    # Load the data
-    df = pd.read_csv(file_path)
-    
-    # Drop unnecessary columns (customize based on your data structure)
-    columns_to_drop = ['topic_id', 'cefr_numeric', 'topic_id_original_categorical', 
-                      'topic_id_original', 'topic_id_categorical', 'topic', 
-                      'secondary_topic', 'topic_to_keep', 'time', 'text',
-                      'writing_id', 'level', 'unit', 'text_number_per_learner_in_task',
-                      'date', 'grade', 'wordcount', 'mtld']
-    
-    # Only drop columns that exist in the dataframe
-    existing_columns_to_drop = [col for col in columns_to_drop if col in df.columns]
-    if existing_columns_to_drop:
-        df.drop(existing_columns_to_drop, axis=1, inplace=True)
-    
-    # Prepare corpus with context
-    corpus = []
-    for _, row in df.iterrows():
-        context = {
-            'l1': row.get('l1', 'unknown'),
-            'cefr': row.get('cefr', 'unknown'),
-            'nationality': row.get('nationality', 'unknown')
-        }
-        corpus.append((row.get('text_corrected', ''), context))
-    
-    logger.info(f"Loaded {len(corpus)} texts for analysis")
-    return corpus
+    # Read only the text and metadata columns, lazily and in chunks (CSV or Parquet)
+    return iter_corpus(file_path, text_column='text_corrected',
+                       context_columns=['l1', 'cefr', 'nationality'],
+                       categorical_columns=['l1', 'cefr', 'nationality'])
 
 def analyze_noun_phrases(corpus):
     """
@@ -311,138 +412,184 @@ def analyze_noun_phrases(corpus):
     """
     logger.info("Starting noun phrase analysis...")
     
-    # Run all annotation functions
-    attributive_adjective = annotate_attributive_adjective(corpus)
-    premodifying_nouns = annotate_premodifying_nouns(corpus)
-    relative_clauses = annotate_relative_clauses(corpus)
-    ing_clauses = annotate_ing_clauses(corpus)
-    ed_clauses = annotate_ed_clauses(corpus)
-    prepositional_phrases_of = annotate_prepositional_phrases_of(corpus)
-    prepositional_phrases_other = annotate_prepositional_phrases_other(corpus)
+    # Run all registered extractors over a single parse of the corpus
+    annotations = run_extractors(corpus)
     
-    # Combine all annotations
-    all_annotations = (attributive_adjective + premodifying_nouns + relative_clauses +
-                      ing_clauses + ed_clauses + prepositional_phrases_of + 
-                      prepositional_phrases_other)
+    # Combine all annotations, grouped by modifier type
+    all_annotations = [annotation for name in annotations for annotation in annotations[name]]
     
     # Convert to DataFrame
     df = pd.DataFrame(all_annotations)
     
     logger.info(f"Total annotations: {len(df)}")
-    logger.info(f"Annotation types: {df['noun_modifier'].value_counts().to_dict()}")
+    if not df.empty:
+        logger.info(f"Annotation types: {df['noun_modifier'].value_counts().to_dict()}")
     
     return df
 
-def create_visualizations(df, output_dir="results"):
+def write_noun_phrases(corpus, annotations_path, sentences_path, first_sentence_id=0, chunk_size=50000):
     """
-    Create visualizations for noun phrase analysis results.
+    Stream the annotations of the corpus into an annotation table and a sentence table.
+    
+    Only one document and one chunk of rows are held in memory at a time.
     
     Args:
-        df: DataFrame containing annotation results
-        output_dir: Directory to save visualization files
+        corpus: Iterable of tuples containing (text, context_dict)
+        annotations_path: Parquet file for the annotation rows
+        sentences_path: Parquet file for the sentences the rows refer to
+        first_sentence_id: Id given to the first sentence
+        chunk_size: Number of annotation rows per Parquet row group
+    
+    Returns:
+        Number of annotations written
     """
-    logger.info("Creating visualizations...")
+    from annotation_store import AnnotationWriter
     
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    logger.info("Starting noun phrase analysis...")
     
-    # Analysis 1: Modifier distribution by CEFR level
-    modifier_distribution = df.groupby(['noun_modifier', 'modifier_position', 'type', 'cefr']).size().unstack(fill_value=0).reset_index()
+    with AnnotationWriter(annotations_path, sentences_path, first_sentence_id, chunk_size) as writer:
+        for doc_annotations in iter_annotations(corpus):
+            writer.add([row for rows in doc_annotations.values() for row in rows])
     
-    # Apply Z-score normalization across each CEFR level column
-    cefr_columns = modifier_distribution.columns[3:]
-    for col in cefr_columns:
-        modifier_distribution[col + '_z'] = zscore(modifier_distribution[col])
+    logger.info(f"Total annotations: {writer.n_annotations} in {writer.n_sentences} sentences")
+    return writer.n_annotations
+
+def analyze_noun_phrases_incremental(corpus, annotations_path, sentences_path, full=False):
+    """
+    Annotate only new or changed documents and merge them into previous results.
+    
+    Documents are identified by the hash of their text. Rows of changed or deleted
+    documents are dropped from both tables; adding, removing or changing an extractor
+    rebuilds everything.
+    
+    Args:
+        corpus: Iterable of tuples containing (text, context_dict)
+        annotations_path: Annotation table of the previous run
+        sentences_path: Sentence table of the previous run
+        full: Re-annotate the whole corpus
+    
+    Returns:
+        Number of annotations in the merged table
+    """
+    from annotation_store import next_sentence_id
+    from common.incremental import merge_parquet
+    
+    version = f"{EXTRACTOR_VERSION}:{','.join(MODIFIER_EXTRACTORS)}"
+    manifest = IncrementalManifest(annotations_path, version, full=full or not os.path.exists(sentences_path))
+    first_sentence_id = 0 if manifest.rebuild else next_sentence_id(sentences_path)
     
-    # Melt the DataFrame for easier plotting
-    data_melted = modifier_distribution.melt(
+    new_annotations_path, new_sentences_path = annotations_path + '.new', sentences_path + '.new'
+    write_noun_phrases(manifest.select(corpus), new_annotations_path, new_sentences_path, first_sentence_id)
+    merge_parquet(sentences_path, new_sentences_path, manifest)
+    n_rows = merge_parquet(annotations_path, new_annotations_path, manifest)
+    
+    manifest.save()
+    logger.info(f"{n_rows} annotations saved to {annotations_path} (sentences in {sentences_path})")
+    return n_rows
+
+def _melt_zscores(modifier_distribution, var_name):
+    """Melt the '<level>_z' columns of a CountCube.zscores table into long format for plotting."""
+    z_score_columns = [col for col in modifier_distribution.columns if col.endswith('_z')]
+    return modifier_distribution.melt(
         id_vars=['noun_modifier', 'modifier_position', 'type'], 
-        value_vars=[col + '_z' for col in cefr_columns], 
-        var_name='CEFR_Level', 
+        value_vars=z_score_columns, 
+        var_name=var_name, 
         value_name='Z_Score'
     )
+
+def plot_zscores(data_melted, hue, title):
+    """Bar plot of the Z-scores of each noun modifier, one bar per level of hue."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
-    # Create bar plot of Z-scores
     plt.figure(figsize=(12, 8))
-    sns.barplot(x='Z_Score', y='noun_modifier', hue='CEFR_Level', data=data_melted)
-    plt.title('Z-Scores of Noun Modifier Usage by CEFR Level')
+    sns.barplot(x='Z_Score', y='noun_modifier', hue=hue, data=data_melted)
+    plt.title(title)
     plt.xlabel('Z-Score')
     plt.ylabel('Noun Modifier')
     plt.tight_layout()
-    plt.savefig(f"{output_dir}/noun_modifier_cefr_analysis.png", dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # Analysis 2: Relative frequencies by CEFR level
-    count_data = df.groupby(['noun_modifier', 'cefr']).size().reset_index(name='Count')
-    total_counts_per_cefr = count_data.groupby('cefr')['Count'].sum()
-    count_data['Relative_Frequency'] = count_data.apply(
-        lambda row: row['Count'] / total_counts_per_cefr[row['cefr']], axis=1)
+
+def plot_relative_frequencies(count_data):
+    """Point plot of the relative frequencies of the noun modifiers per CEFR level."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
-    # Create relative frequency plot
-    plt.figure(figsize=(12, 8))
     g = sns.catplot(x='Relative_Frequency', y='noun_modifier', hue='cefr', 
                     col="cefr", data=count_data, capsize=.2, palette="YlGnBu_d", 
                     errorbar="se", kind="point", height=6, aspect=.75)
     g.fig.suptitle('Relative Frequencies of Noun Modifiers by CEFR Level', y=1.02)
     plt.tight_layout()
-    plt.savefig(f"{output_dir}/noun_modifier_relative_frequencies.png", dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # Analysis 3: Native language analysis
-    modifier_distribution_nl = df.groupby(['noun_modifier', 'modifier_position', 'type', 'native_language']).size().unstack(fill_value=0).reset_index()
+
+def create_visualizations(cube, output_dir="results"):
+    """
+    Create visualizations for noun phrase analysis results.
     
-    language_columns = modifier_distribution_nl.columns[3:]
-    for col in language_columns:
-        modifier_distribution_nl[col + '_z'] = zscore(modifier_distribution_nl[col])
+    The summary tables are computed from the count cube here; the figures are drawn
+    from them in parallel, headless worker processes, and figures whose tables did
+    not change since the last run are skipped (see common.rendering).
     
-    z_score_columns = [col for col in modifier_distribution_nl.columns if col.endswith('_z')]
-    data_melted_nl = modifier_distribution_nl.melt(
-        id_vars=['noun_modifier', 'modifier_position', 'type'], 
-        value_vars=z_score_columns, 
-        var_name='First_Languages', 
-        value_name='Z_Score'
-    )
+    Args:
+        cube: CountCube of the annotation results
+        output_dir: Directory to save visualization files
+    """
+    from common.rendering import FigureJob, render_figures  # selects the headless Agg backend
+    import seaborn as sns
     
-    # Create native language analysis plot
-    plt.figure(figsize=(12, 8))
-    sns.barplot(x='Z_Score', y='noun_modifier', hue='First_Languages', data=data_melted_nl)
-    plt.title('Z-Scores of Noun Modifier Usage by First Languages')
-    plt.xlabel('Z-Score')
-    plt.ylabel('Noun Modifier')
-    plt.tight_layout()
-    plt.savefig(f"{output_dir}/noun_modifier_l1_analysis.png", dpi=300, bbox_inches='tight')
-    plt.show()
+    logger.info("Creating visualizations...")
+    sns.set_theme(style="darkgrid")  # inherited by the render workers
+    
+    jobs = [
+        # Analysis 1: Modifier distribution by CEFR level, Z-score normalized within each CEFR level
+        FigureJob(f"{output_dir}/noun_modifier_cefr_analysis.png", plot_zscores,
+                  _melt_zscores(cube.zscores('cefr'), 'CEFR_Level'),
+                  hue='CEFR_Level', title='Z-Scores of Noun Modifier Usage by CEFR Level'),
+        # Analysis 2: Relative frequencies by CEFR level
+        FigureJob(f"{output_dir}/noun_modifier_relative_frequencies.png", plot_relative_frequencies,
+                  cube.relative_frequencies('cefr')),
+        # Analysis 3: Native language analysis
+        FigureJob(f"{output_dir}/noun_modifier_l1_analysis.png", plot_zscores,
+                  _melt_zscores(cube.zscores('native_language'), 'First_Languages'),
+                  hue='First_Languages', title='Z-Scores of Noun Modifier Usage by First Languages'),
+    ]
+    render_figures(jobs)
     
     logger.info(f"Visualizations saved to {output_dir}/")
 
-def main():
+def main(full=False, figures=True):
     """Main function to run the noun phrase analysis."""
     logger.info("Starting Noun Phrase Analysis for Learner English")
     
     # Load corpus data
     corpus = load_corpus_data('sample_data.csv')  # Replace with your data file
     
-    # Perform analysis
-    results_df = analyze_noun_phrases(corpus)
+    # Annotate new or changed documents and merge them into the saved results
+    annotations_path, sentences_path = 'noun_phrase_annotations.parquet', 'noun_phrase_sentences.parquet'
+    analyze_noun_phrases_incremental(corpus, annotations_path, sentences_path, full=full)
     
-    # Save results
-    results_df.to_csv('noun_phrase_results.csv', index=False)
-    logger.info("Results saved to noun_phrase_results.csv")
+    # Count the annotations once; statistics and plots work on the counts only
+    from count_cube import CountCube
+    cube = CountCube.build(annotations_path)
     
-    # Create visualizations
-    create_visualizations(results_df)
+    # Create visualizations, unless this is a pipeline run without figures
+    from common.rendering import figures_enabled
+    if figures and figures_enabled():
+        create_visualizations(cube)
     
     # Display summary statistics
     print("\n=== SUMMARY STATISTICS ===")
-    print(f"Total noun phrase modifications found: {len(results_df)}")
-    print(f"Number of unique modifier types: {results_df['noun_modifier'].nunique()}")
-    print(f"CEFR levels analyzed: {sorted(results_df['cefr'].unique())}")
-    print(f"Native languages analyzed: {sorted(results_df['native_language'].unique())}")
+    print(f"Total noun phrase modifications found: {cube.total}")
+    print(f"Number of unique modifier types: {len(cube.levels('noun_modifier'))}")
+    print(f"CEFR levels analyzed: {cube.levels('cefr')}")
+    print(f"Native languages analyzed: {cube.levels('native_language')}")
     
     print("\n=== MODIFIER TYPE DISTRIBUTION ===")
-    print(results_df['noun_modifier'].value_counts())
+    print(cube.marginal('noun_modifier').sort_values(ascending=False))
     
     logger.info("Analysis completed successfully!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='re-annotate the whole corpus instead of only new or changed documents')
+    parser.add_argument('--no-figures', action='store_true', help='skip the figures (same as FIGURES=none)')
+    args = parser.parse_args()
+    main(full=args.full, figures=not args.no_figures)
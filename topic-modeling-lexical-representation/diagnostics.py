@@ -0,0 +1,108 @@
+"""
+Topic Diagnostics
+=================
+
+Entropy and L1 diagnostics for a BERTopic document-topic probability matrix
+(``probs`` from ``fit_transform`` with ``calculate_probabilities=True``).
+
+Everything is computed in one pass over row chunks, so only one chunk of the
+N x K matrix is normalised at a time and the memory use is bounded by
+``max_memory_mb`` however many documents there are. ``probs`` may also be a
+memory-mapped array. Zero probabilities contribute 0 to the entropy (as in
+``scipy.special.xlogy``) instead of NaN, and documents whose probabilities are
+all zero are left at entropy 0.
+
+Computed per run:
+
+- per-topic entropy: ``-sum_d p(d, k) * log2 p(d, k)`` over the row-normalised
+  matrix, the score used in the published analysis;
+- per-document entropy: ``-sum_k p(d, k) * log2 p(d, k)``;
+- per-L1 topic distribution: the mean normalised topic probabilities of the
+  documents of each native language.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_MEMORY_MB = 256
+
+
+class TopicDiagnostics:
+    """Results of topic_diagnostics()."""
+
+    def __init__(self, topic_entropy, document_entropy, l1_distribution=None):
+        """
+        Args:
+            topic_entropy: DataFrame with 'Topic' and 'Entropy' columns
+            document_entropy: Array with the entropy of each document
+            l1_distribution: DataFrame of mean topic probabilities (rows: L1, columns: topics), if groups were given
+        """
+        self.topic_entropy = topic_entropy
+        self.document_entropy = document_entropy
+        self.l1_distribution = l1_distribution
+
+
+def chunk_rows(n_topics, dtype=np.float32, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Number of rows per chunk so that a chunk and its log terms fit in max_memory_mb."""
+    bytes_per_row = 2 * n_topics * np.dtype(dtype).itemsize
+    return max(1, int(max_memory_mb * 1024 ** 2 // max(bytes_per_row, 1)))
+
+
+def topic_diagnostics(probs, groups=None, dtype=np.float32, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """
+    Compute topic and document entropies, and per-L1 topic distributions.
+
+    Args:
+        probs: Document-topic probabilities, shape (n_docs, n_topics); an array, memmap or nested list
+        groups: Optional L1 label of each document (e.g. df['Native_Language'])
+        dtype: Working precision of each chunk (np.float32 halves the memory of np.float64)
+        max_memory_mb: Memory budget for one chunk of the working arrays
+
+    Returns:
+        TopicDiagnostics
+    """
+    probs = probs if isinstance(probs, np.ndarray) else np.asarray(probs, dtype=dtype)
+    n_docs, n_topics = probs.shape
+    step = chunk_rows(n_topics, dtype, max_memory_mb)
+
+    if groups is not None:
+        codes, labels = pd.factorize(pd.Series(groups), use_na_sentinel=False)
+        group_sums = np.zeros((len(labels), n_topics), dtype=np.float64)
+        group_counts = np.bincount(codes, minlength=len(labels))
+
+    topic_entropy = np.zeros(n_topics, dtype=np.float64)
+    document_entropy = np.zeros(n_docs, dtype=dtype)
+    log_terms = np.empty((min(step, n_docs), n_topics), dtype=dtype)
+
+    for start in range(0, n_docs, step):
+        stop = min(start + step, n_docs)
+        chunk = np.array(probs[start:stop], dtype=dtype)
+        terms = log_terms[:stop - start]
+
+        # Normalise each row in place; all-zero rows stay zero
+        row_sums = chunk.sum(axis=1, keepdims=True)
+        np.divide(chunk, row_sums, out=chunk, where=row_sums > 0)
+
+        # p * log2(p) with 0 * log2(0) = 0, without NaNs or extra N x K temporaries
+        terms.fill(0)
+        np.log2(chunk, out=terms, where=chunk > 0)
+        terms *= chunk
+
+        document_entropy[start:stop] = -terms.sum(axis=1)
+        topic_entropy -= terms.sum(axis=0, dtype=np.float64)
+
+        if groups is not None:
+            chunk_codes = codes[start:stop]
+            for code in np.unique(chunk_codes):
+                group_sums[code] += chunk[chunk_codes == code].sum(axis=0, dtype=np.float64)
+
+    l1_distribution = None
+    if groups is not None:
+        l1_distribution = pd.DataFrame(group_sums / np.maximum(group_counts, 1)[:, None],
+                                       index=pd.Index(labels, name='Native_Language'))
+
+    return TopicDiagnostics(pd.DataFrame({'Topic': range(n_topics), 'Entropy': topic_entropy}),
+                            document_entropy, l1_distribution)
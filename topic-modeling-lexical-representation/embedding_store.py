@@ -0,0 +1,145 @@
+"""
+Sentence Embedding Store
+========================
+
+Persistent, memory-mapped store of document embeddings for repeated BERTopic runs.
+
+Embeddings are keyed by the hash of the document text and stored per embedding model,
+so tuning UMAP, HDBSCAN or ``nr_topics`` never re-encodes the corpus: documents are
+encoded once, in batches, and later runs only encode documents that were added since.
+Pass the result to ``topic_model.fit_transform(docs, embeddings=embeddings)``.
+
+Layout::
+
+    <store_dir>/<model>/vectors.f32   float32 rows, appended as new documents are encoded
+    <store_dir>/<model>/keys.txt      text hash of each row, one per line
+    <store_dir>/<model>/meta.json     model name and embedding dimension
+
+Rows are appended before their keys, so an interrupted run never indexes a row that
+was not completely written.
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+from common.parse_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = 'embeddings'
+
+
+class EmbeddingStore:
+    """Append-only embedding store for one sentence-transformers model."""
+
+    def __init__(self, model_name, store_dir=DEFAULT_STORE_DIR, model=None, batch_size=64, device=None):
+        """
+        Args:
+            model_name: sentence-transformers model name, e.g. 'all-MiniLM-L12-v2'
+            store_dir: Directory holding the stores of all models
+            model: Already loaded SentenceTransformer for model_name (loaded on demand otherwise)
+            batch_size: Number of documents encoded at once
+            device: Device for encoding ('cpu', 'cuda', ...); None lets sentence-transformers choose
+        """
+        self.model_name = model_name
+        self.model = model
+        self.batch_size = batch_size
+        self.device = device
+        self.path = os.path.join(store_dir, re.sub(r'[^\w.-]+', '_', model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, 'vectors.f32')
+        self.keys_path = os.path.join(self.path, 'keys.txt')
+        self.meta_path = os.path.join(self.path, 'meta.json')
+
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        self.index = {}
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, encoding='utf-8') as f:
+                for row, key in enumerate(f.read().split()):
+                    self.index[key] = row
+
+    def __len__(self):
+        return len(self.index)
+
+    def vectors(self):
+        """Memory-map the stored embeddings (rows in storage order)."""
+        if not self.index:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self.index), self.dim))
+
+    def add(self, docs, chunk_size=10000):
+        """
+        Encode and store every document that is not in the store yet.
+
+        Args:
+            docs: Iterable of document texts
+            chunk_size: Number of documents encoded between two writes to disk
+
+        Returns:
+            Number of newly encoded documents
+        """
+        missing = {}
+        for doc in docs:
+            key = text_hash(doc)
+            if key not in self.index and key not in missing:
+                missing[key] = doc
+        logger.info(f"Embedding store: {len(missing)} documents to encode with {self.model_name}")
+        if not missing:
+            return 0
+
+        keys = list(missing)
+        for start in range(0, len(keys), chunk_size):
+            chunk_keys = keys[start:start + chunk_size]
+            vectors = self._encode([missing[key] for key in chunk_keys])
+            self._append(chunk_keys, vectors)
+            logger.info(f"Encoded {min(start + chunk_size, len(keys))}/{len(keys)} documents")
+        return len(keys)
+
+    def encode(self, docs):
+        """
+        Return the embeddings of docs in input order, encoding only unseen documents.
+
+        Args:
+            docs: Sequence of document texts
+
+        Returns:
+            float32 array of shape (len(docs), dim)
+        """
+        docs = list(docs)
+        self.add(docs)
+        rows = np.fromiter((self.index[text_hash(doc)] for doc in docs), dtype=np.int64, count=len(docs))
+        return np.asarray(self.vectors()[rows])
+
+    def _encode(self, texts):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+        vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def _append(self, keys, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model_name, 'dim': self.dim}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self.dim})")
+
+        with open(self.vectors_path, 'ab') as f:
+            # Drop rows of an interrupted write that never got their keys
+            f.truncate(len(self.index) * self.dim * 4)
+            f.write(vectors.tobytes())
+        with open(self.keys_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(key + '\n' for key in keys))
+        for key in keys:
+            self.index[key] = len(self.index)
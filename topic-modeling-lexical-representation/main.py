@@ -1,66 +1,67 @@
 ## First Import Necessary Packages
-from bertopic import BERTopic
-from bertopic.representation import KeyBERTInspired
-from bertopic.representation import MaximalMarginalRelevance
-from umap import UMAP
-from hdbscan import HDBSCAN
-from bertopic.vectorizers import ClassTfidfTransformer
-from keybert import KeyBERT
-from sentence_transformers import SentenceTransformer
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.feature_extraction import _stop_words
+### Only light packages are imported here; BERTopic, UMAP, HDBSCAN, sentence-transformers, OpenAI,
+### gensim and the plotting libraries are imported by the step that uses them, so each step only
+### pays for its own libraries (see benchmarks/import_time.py)
 import pandas as pd
-import re
-import torch
-torch.device("mps")
-import spacy
 import os
-nlp = spacy.load('en_core_web_trf',disable=['ner', 'parser'])
-spacy.require_gpu()
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus import clean_icle_text
+from common.execution import setup_execution
+from common.lemmatize import lemmatize_texts, load_lemmatizer
+from diagnostics import topic_diagnostics
+from embedding_store import EmbeddingStore
+execution = setup_execution()
+### Lemmas and stop word flags do not need the transformer; set to True to use the much faster en_core_web_sm
+LIGHTWEIGHT_LEMMATIZER = False
+nlp = load_lemmatizer(lightweight=LIGHTWEIGHT_LEMMATIZER)
 nlp.max_length = 10000000000000
-pattern = r'ICLE\-\w+\-\w+\-\d+\.\d+'
 pattern_ = r'[^\w\s]'
 
-### Next step is required if you want ChatGPT to provide represetations for your terms. Also note that you need an OpenAI account.
-import os
-import openai
-import chardet
-openai.organization = "your_OPENai_Organization" 
-openai.api_key = ("your_OPENai_API_Key")
-from bertopic.representation import OpenAI
-
 ###Next clean texts and utilize Spacy for lemmatisation task.
 df = pd.read_csv("your_data_here") ### Since ICLE corpus is copyrighted I cannot share the full dataset.
-df['text_field'] = df['text_field'].apply(lambda x: re.sub(pattern, '', x).replace('\n', ''))
+df['text_field'] = [clean_icle_text(text) for text in df['text_field']]
 df = df.rename(columns={'Native language': 'Native_Language'})
-df['text_field'] = df['text_field'].apply(lambda x: re.sub(pattern, '', x).replace('\n', ''))
-
-###Next step removes stop words and lemmatize whole corpus
 
-df['lemmatized_text'] = df['text_field'].apply(lambda x: ' '.join([token.lemma_ for token in nlp(x) if not token.is_stop]))
+###Next step removes stop words and lemmatize whole corpus in batches; lemmatized essays are cached on disk by text hash
+df['lemmatized_text'] = lemmatize_texts(nlp, df['text_field'], **execution.pipe_kwargs())
 docs = df['lemmatized_text']
 
 # Step 1 - /Users/t embeddings
+from sentence_transformers import SentenceTransformer
 embedding_model = SentenceTransformer('all-MiniLM-L12-v2')
+### Embeddings are stored on disk by document hash, so reruns with other UMAP/HDBSCAN settings only encode new documents
+embedding_store = EmbeddingStore('all-MiniLM-L12-v2', model=embedding_model)
+embeddings = embedding_store.encode(docs)
 
 # Step 2 - Reduce dimensionality
+from umap import UMAP
 umap_model = UMAP(n_neighbors=20, n_components=5, min_dist=0.0, metric='cosine', random_state=123)
 ### Note that due to scholastics nature of umap method, without defining a random_state, each run would provide different results.
 ### Hence, for my study, random_state = 123, for those who wish to test and replicate the study with the same data.
 
 # Step 3 - Cluster reduced embeddings
+from hdbscan import HDBSCAN
 hdbscan_model = HDBSCAN(min_cluster_size=30, metric='euclidean', cluster_selection_method='eom', prediction_data=True)
 
 # Step 4 - Tokenize topics
+from sklearn.feature_extraction.text import CountVectorizer
 vectorizer_model = CountVectorizer(stop_words="english")
 
 # Step 5 - Create topic representation
+from bertopic.vectorizers import ClassTfidfTransformer
 ctfidf_model = ClassTfidfTransformer()
 
 # Step 6 - (Optional) Fine-tune topic representations with 
 # a `OpenAI's ChatGPT` model
+### This step is required if you want ChatGPT to provide represetations for your terms. Also note that you need an OpenAI account.
+import openai
+openai.organization = "your_OPENai_Organization" 
+openai.api_key = ("your_OPENai_API_Key")
+from bertopic.representation import OpenAI
 representation_model = OpenAI()
 
+from bertopic import BERTopic
 topic_model = BERTopic(
   embedding_model=embedding_model,          # Step 1 - Extract embeddings
   umap_model=umap_model,                    # Step 2 - Reduce dimensionality
@@ -69,18 +70,17 @@ topic_model = BERTopic(
   representation_model=representation_model,# Step 6 - (Optional) Fine-tune topic representations
   calculate_probabilities=True,verbose=True, nr_topics = 'auto', top_n_words = 10, min_topic_size  = 30)
   
-topics, probs = topic_model.fit_transform(docs)
+topics, probs = topic_model.fit_transform(docs, embeddings=embeddings)
 topic_info = topic_model.get_topic_info()
 topic_info = topic_info[topic_info['Topic'] != -1] ### this removes outliner documents
 
 #Next step is to calculate entropy score
 import numpy as np
-doc_topic_matrix = np.array(probs)
-normalized_doc_topic_matrix = doc_topic_matrix / doc_topic_matrix.sum(axis=1, keepdims=True)
-# Calculate topic entropy
-topic_entropy = (-normalized_doc_topic_matrix * np.log2(normalized_doc_topic_matrix)).sum(axis=0)
-# Create a DataFrame with topic entropy values
-entropy_df = pd.DataFrame({'Topic': range(len(topic_entropy)), 'Entropy': topic_entropy})
+# Topic and document entropies and per-L1 topic distributions, computed chunk by chunk in a fixed memory budget
+diagnostics = topic_diagnostics(probs, groups=df['Native_Language'])
+entropy_df = diagnostics.topic_entropy
+df['topic_entropy'] = diagnostics.document_entropy
+l1_topic_distribution = diagnostics.l1_distribution
 # Sort the DataFrame by entropy in descending order
 sorted_entropy_df = entropy_df.sort_values('Entropy', ascending=False)
 sorted_entropy_df
@@ -89,6 +89,7 @@ sorted_entropy_df
 topic_info = topic_info.merge(sorted_entropy_df, on='Topic')
 
 ### Visualize the top 10 terms in Topic 0 
+from common.rendering import FigureJob, render_figures  # selects the headless Agg backend
 import seaborn as sns
 import matplotlib.pyplot as plt
 
@@ -104,59 +105,56 @@ filtered_topic_words = [topic_model.get_topic(desired_topic)]
 topic_df = pd.DataFrame(filtered_topic_words[0], columns=['Word', 'c-TF-IDF'])
 
 # Create a bar plot to visualize the words and their c-TF-IDF scores
-sns.set(style="whitegrid", font = 'Times New Roman')
-plt.figure(figsize=(10, 6))
-sns.barplot(x='c-TF-IDF', y='Word', data=topic_df, palette='viridis')
-plt.title(f'Terms with Higher c-TF-IDF scores for Topic {desired_topic}')
-plt.xlabel('c-TF-IDF Score')
-plt.ylabel('Terms')
-plt.show()
+def plot_topic_terms(topic_df, topic):
+    sns.set(style="whitegrid", font = 'Times New Roman')
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x='c-TF-IDF', y='Word', data=topic_df, palette='viridis')
+    plt.title(f'Terms with Higher c-TF-IDF scores for Topic {topic}')
+    plt.xlabel('c-TF-IDF Score')
+    plt.ylabel('Terms')
 
 
 ### Visualize all topics with their frequencies and entropy scores
 
-# Set plot style and size
-sns.set(style="whitegrid", font = 'Times New Roman')
-plt.figure(figsize=(20, 12))
-
-# Create a bar plot for the 'Count' column
-bar_plot = sns.barplot(x="CustomName", y="Count", data=topic_info, color="b", alpha=0.6)
+def plot_topic_overview(topic_info):
+    # Set plot style and size
+    sns.set(style="whitegrid", font = 'Times New Roman')
+    plt.figure(figsize=(20, 12))
 
-# Set the x-axis and y-axis labels with increased font size for the x-axis label
-bar_plot.set_xlabel("Custom Term Labels", fontsize=14)
-bar_plot.set_ylabel("Frequency")
+    # Create a bar plot for the 'Count' column
+    bar_plot = sns.barplot(x="CustomName", y="Count", data=topic_info, color="b", alpha=0.6)
 
-# Rotate x-axis labels for better readability and increase font size
-bar_plot.set_xticklabels(bar_plot.get_xticklabels(), rotation=90, fontsize=12)
+    # Set the x-axis and y-axis labels with increased font size for the x-axis label
+    bar_plot.set_xlabel("Custom Term Labels", fontsize=14)
+    bar_plot.set_ylabel("Frequency")
 
-# Create a line plot for the 'Entropy' column with a secondary y-axis
-entropy_plot = bar_plot.twinx()
-sns.lineplot(x="CustomName", y="Entropy", data=topic_info, color="r", marker="o", linestyle="-", ax=entropy_plot)
+    # Rotate x-axis labels for better readability and increase font size
+    bar_plot.set_xticklabels(bar_plot.get_xticklabels(), rotation=90, fontsize=12)
 
-# Set the y-axis label for the line plot
-entropy_plot.set_ylabel("Entropy Scores")
+    # Create a line plot for the 'Entropy' column with a secondary y-axis
+    entropy_plot = bar_plot.twinx()
+    sns.lineplot(x="CustomName", y="Entropy", data=topic_info, color="r", marker="o", linestyle="-", ax=entropy_plot)
 
-# Find the label with the highest entropy
-highest_entropy_label = topic_info.loc[topic_info['Entropy'].idxmax()]
+    # Set the y-axis label for the line plot
+    entropy_plot.set_ylabel("Entropy Scores")
 
-# Annotate the label with the highest entropy
-bar_plot.annotate('Highest entropy', xy=(highest_entropy_label["CustomName"], highest_entropy_label["Count"]),
-                  xytext=(highest_entropy_label["CustomName"], highest_entropy_label["Count"]+0.05*topic_info["Count"].max()),
-                  arrowprops=dict(facecolor='black', shrink=0.05),
-                  fontsize=12, color='black', rotation=90)
+    # Find the label with the highest entropy
+    highest_entropy_label = topic_info.loc[topic_info['Entropy'].idxmax()]
 
-# Set the title for the plot
+    # Annotate the label with the highest entropy
+    bar_plot.annotate('Highest entropy', xy=(highest_entropy_label["CustomName"], highest_entropy_label["Count"]),
+                      xytext=(highest_entropy_label["CustomName"], highest_entropy_label["Count"]+0.05*topic_info["Count"].max()),
+                      arrowprops=dict(facecolor='black', shrink=0.05),
+                      fontsize=12, color='black', rotation=90)
 
-
-# Show the plot
-plt.show()
+# Render both figures headless and in parallel from their summary tables; unchanged figures
+# are skipped and FIGURES=none skips them all
+render_figures([
+    FigureJob(f'topic_{desired_topic}_terms.png', plot_topic_terms, topic_df, topic=desired_topic),
+    FigureJob('topic_overview.png', plot_topic_overview, topic_info[['CustomName', 'Count', 'Entropy']]),
+])
 ### The end of Topic Modeling. Next is to train Gensin Word2Vec model over the essays sharing Topic 0 ###
 
-from pprint import pprint
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.feature_extraction import _stop_words
-from gensim.models import word2vec
-from gensim.utils import simple_preprocess
 from gensim.utils import simple_preprocess
 from gensim.models import Word2Vec
 
@@ -277,6 +275,8 @@ for word, related in related_words.items():
 
 ### Visualize Results in a Semantic Map ###
 
+import networkx as nx
+
 def plot_semantic_map_connected(related_words_dict, threshold=0.5):
     G = nx.Graph()
 
@@ -324,10 +324,9 @@ def plot_semantic_map_connected(related_words_dict, threshold=0.5):
     edge_labels = {(u, v): '{:.2f}'.format(d["weight"]) for u, v, d in G.edges(data=True)}
     nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='red')
 
-    # Display the plot
     plt.axis("off")
-    plt.show()
 
-# Call the function to plot the connected semantic map
-plot_semantic_map_connected(related_words, threshold=0.9)
+# Render the connected semantic map headless (target words missing from the vocabulary have no neighbours to draw)
+render_figures([FigureJob('semantic_map.png', plot_semantic_map_connected,
+                          {word: related for word, related in related_words.items() if related}, threshold=0.9)])
 
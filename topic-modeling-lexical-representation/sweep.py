@@ -0,0 +1,245 @@
+"""
+UMAP/HDBSCAN Hyperparameter Sweep
+=================================
+
+Evaluates a grid of UMAP and HDBSCAN settings for the BERTopic pipeline in one
+parallel job instead of editing ``umap_model``/``hdbscan_model`` and rerunning main.py.
+
+The sweep runs in two parallel phases:
+
+1. One UMAP reduction per distinct (n_neighbors, n_components, min_dist) setting. Each
+   reduction is cached on disk, keyed by the embeddings and the UMAP settings, so it is
+   shared by all HDBSCAN settings and by later sweeps.
+2. One HDBSCAN clustering per configuration, on the memory-mapped cached reduction.
+
+For every configuration the results table records the number of topics, the outlier
+ratio, the mean topic entropy (over the soft cluster memberships, as with
+``calculate_probabilities=True``) and the mean NPMI coherence of the top c-TF-IDF words
+of each topic. Topic reduction (``nr_topics``) and representation models are not part
+of the sweep.
+
+Usage::
+
+    python sweep.py your_data_here.csv --workers 8 --output sweep_results.csv
+
+Author: Fatih Ünal Bozdağ
+Email: fbozdag1989@gmail.com
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+logger = logging.getLogger(__name__)
+
+UMAP_PARAMS = ('n_neighbors', 'n_components', 'min_dist')
+HDBSCAN_PARAMS = ('min_cluster_size', 'cluster_selection_method')
+
+# Grid around the settings used in main.py
+DEFAULT_GRID = {
+    'n_neighbors': [10, 20, 40],
+    'n_components': [5, 10],
+    'min_dist': [0.0, 0.1],
+    'min_cluster_size': [15, 30, 60],
+    'cluster_selection_method': ['eom', 'leaf'],
+}
+RANDOM_STATE = 123
+TOP_N_WORDS = 10
+VECTORIZER_SETTINGS = {'stop_words': 'english'}  # CountVectorizer of the coherence document-term matrix
+
+
+def expand_grid(grid):
+    """Return the list of configurations (dicts) in the cartesian product of a parameter grid."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _umap_key(embeddings_hash, umap_settings):
+    settings = json.dumps(dict(umap_settings, random_state=RANDOM_STATE), sort_keys=True)
+    return hashlib.sha1((embeddings_hash + settings).encode('utf-8')).hexdigest()[:16]
+
+
+def _reduce(embeddings_path, umap_settings, reduction_path):
+    """Phase 1 worker: compute one UMAP reduction unless it is cached."""
+    if os.path.exists(reduction_path):
+        return reduction_path
+    from umap import UMAP
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    reduced = UMAP(metric='cosine', random_state=RANDOM_STATE, **umap_settings).fit_transform(embeddings)
+    tmp_path = reduction_path[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp_path, reduced.astype(np.float32))
+    os.replace(tmp_path, reduction_path)
+    return reduction_path
+
+
+def topic_word_scores(doc_term, labels, n_topics):
+    """
+    Compute BERTopic's class-based TF-IDF of every word for every topic.
+
+    Args:
+        doc_term: Sparse document-term count matrix
+        labels: Topic of each document (-1 for outliers)
+        n_topics: Number of topics
+
+    Returns:
+        Dense array of shape (n_topics, n_words)
+    """
+    import scipy.sparse as sp
+
+    inliers = labels >= 0
+    membership = sp.csr_matrix((np.ones(inliers.sum()), (labels[inliers], np.flatnonzero(inliers))),
+                               shape=(n_topics, doc_term.shape[0]))
+    tf = np.asarray((membership @ doc_term).todense(), dtype=np.float64)
+    avg_words = tf.sum() / max(n_topics, 1)
+    idf = np.log(1 + avg_words / np.maximum(tf.sum(axis=0), 1))
+    return tf / np.maximum(tf.sum(axis=1, keepdims=True), 1) * idf
+
+
+def npmi_coherence(doc_presence, top_words):
+    """
+    Mean normalised PMI over all pairs of top words of each topic, using document co-occurrence.
+
+    Args:
+        doc_presence: Sparse binary document-term matrix (CSC)
+        top_words: Array of shape (n_topics, top_n) with word indices
+
+    Returns:
+        Array with the coherence of each topic
+    """
+    n_docs = doc_presence.shape[0]
+    scores = []
+    for words in top_words:
+        columns = doc_presence[:, words]
+        joint = np.asarray((columns.T @ columns).todense(), dtype=np.float64) / n_docs
+        p = np.diag(joint)
+        i, j = np.triu_indices(len(words), k=1)
+        p_ij = joint[i, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            npmi = np.log(p_ij / (p[i] * p[j])) / -np.log(p_ij)
+        npmi[p_ij == 0] = -1.0
+        scores.append(np.nanmean(npmi) if len(npmi) else np.nan)
+    return np.array(scores)
+
+
+def _cluster(reduction_path, doc_term_path, config):
+    """Phase 2 worker: cluster one cached reduction and score the topics."""
+    import scipy.sparse as sp
+    from hdbscan import HDBSCAN, all_points_membership_vectors
+    from diagnostics import topic_diagnostics
+    reduced = np.load(reduction_path, mmap_mode='r')
+    clusterer = HDBSCAN(min_cluster_size=config['min_cluster_size'], metric='euclidean',
+                        cluster_selection_method=config['cluster_selection_method'], prediction_data=True)
+    labels = clusterer.fit_predict(reduced)
+    n_topics = int(labels.max()) + 1
+    result = dict(config, n_topics=n_topics, outlier_ratio=float(np.mean(labels < 0)),
+                  mean_topic_entropy=np.nan, coherence_npmi=np.nan)
+    if n_topics < 2:
+        return result
+
+    # Entropy of each topic over the normalised soft memberships of all documents
+    probs = all_points_membership_vectors(clusterer)
+    result['mean_topic_entropy'] = float(topic_diagnostics(probs).topic_entropy['Entropy'].mean())
+
+    doc_term = sp.load_npz(doc_term_path).tocsr()
+    scores = topic_word_scores(doc_term, labels, n_topics)
+    top_words = np.argsort(-scores, axis=1)[:, :TOP_N_WORDS]
+    presence = (doc_term > 0).astype(np.float64).tocsc()
+    result['coherence_npmi'] = float(np.nanmean(npmi_coherence(presence, top_words)))
+    return result
+
+
+def run_sweep(docs, embeddings, grid=None, cache_dir='sweep_cache', workers=None):
+    """
+    Evaluate every UMAP/HDBSCAN configuration of a grid.
+
+    Args:
+        docs: Preprocessed documents (e.g. the lemmatized texts)
+        embeddings: Document embeddings, shape (n_docs, dim)
+        grid: Dict of parameter -> list of values (defaults to DEFAULT_GRID)
+        cache_dir: Directory for the embeddings, the document-term matrix and UMAP reductions
+        workers: Number of worker processes (defaults to the number of cores)
+
+    Returns:
+        DataFrame with one row per configuration
+    """
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Share the inputs with the workers through files instead of pickling them per task
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    embeddings_hash = hashlib.sha1(embeddings.tobytes()).hexdigest()
+    embeddings_path = os.path.join(cache_dir, f'embeddings_{embeddings_hash[:16]}.npy')
+    if not os.path.exists(embeddings_path):
+        np.save(embeddings_path, embeddings)
+    # The document-term matrix depends only on the documents and the vectorizer settings
+    docs_hash = hashlib.sha1(repr(sorted(VECTORIZER_SETTINGS.items())).encode('utf-8'))
+    for doc in docs:
+        docs_hash.update(doc.encode('utf-8') + b'\0')
+    doc_term_path = os.path.join(cache_dir, f'doc_term_{docs_hash.hexdigest()[:16]}.npz')
+    if not os.path.exists(doc_term_path):
+        sp.save_npz(doc_term_path, CountVectorizer(**VECTORIZER_SETTINGS).fit_transform(docs).astype(np.int32))
+
+    configs = expand_grid(grid)
+    umap_settings = {tuple(config[name] for name in UMAP_PARAMS) for config in configs}
+    reduction_paths = {values: os.path.join(cache_dir, f'umap_{_umap_key(embeddings_hash, dict(zip(UMAP_PARAMS, values)))}.npy')
+                       for values in umap_settings}
+    logger.info(f"Sweeping {len(configs)} configurations over {len(umap_settings)} UMAP reductions")
+
+    # Spawn the workers: forking a parent that has loaded torch (lemmatizer, embedding model)
+    # can deadlock on its thread pools; the workers only need the module-level _reduce/_cluster
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(_reduce, itertools.repeat(embeddings_path),
+                      [dict(zip(UMAP_PARAMS, values)) for values in reduction_paths],
+                      reduction_paths.values()))
+        results = list(pool.map(_cluster,
+                                [reduction_paths[tuple(config[name] for name in UMAP_PARAMS)] for config in configs],
+                                itertools.repeat(doc_term_path), configs))
+
+    return pd.DataFrame(results).sort_values('coherence_npmi', ascending=False, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a grid of UMAP/HDBSCAN settings for BERTopic')
+    parser.add_argument('data', help='CSV file with a text_field column')
+    parser.add_argument('--grid', help='JSON file with parameter lists overriding DEFAULT_GRID')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from common.corpus import clean_icle_text
+    from common.execution import setup_execution
+    from common.lemmatize import lemmatize_texts, load_lemmatizer
+    from embedding_store import EmbeddingStore
+
+    # Same preprocessing and embeddings as main.py; both are served from their caches on reruns
+    texts = [clean_icle_text(text) for text in pd.read_csv(args.data, usecols=['text_field'])['text_field'].fillna('')]
+    execution = setup_execution()
+    docs = lemmatize_texts(load_lemmatizer(), texts, **execution.pipe_kwargs())
+    embeddings = EmbeddingStore('all-MiniLM-L12-v2').encode(docs)
+
+    grid = None
+    if args.grid:
+        with open(args.grid, encoding='utf-8') as f:
+            grid = json.load(f)
+    results = run_sweep(docs, embeddings, grid, workers=args.workers)
+    results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()